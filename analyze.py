@@ -0,0 +1,86 @@
+"""Análise em lote de jogos: quantos são ganháveis com as regras escolhidas.
+
+Gera jogos a partir de seeds consecutivas e resolve-os em paralelo com um
+pool de processos, escrevendo uma linha CSV por jogo:
+
+    python analyze.py --count 1000000 --draw 3 --output deals_draw3.csv
+
+A coluna ``winnable`` fica vazia nos jogos que o solver não conseguiu
+decidir dentro do orçamento (estado "unknown").
+"""
+import argparse
+import csv
+import multiprocessing
+import sys
+import time
+
+from game import Game, shuffled_deck
+from solver import SOLVED, UNWINNABLE, solve
+
+FIELDS = ("seed", "draw", "passes", "status", "winnable", "solution_length", "nodes", "seconds")
+
+
+def analyze_deal(task):
+    """Resolve um jogo; corre nos processos do pool."""
+    seed, draw, passes, max_nodes, time_limit = task
+    game = Game(draw, passes)
+    game.deal(shuffled_deck(seed))
+    start = time.perf_counter()
+    result = solve(game, max_nodes, time_limit)
+    return (
+        seed,
+        draw,
+        passes,
+        result.status,
+        {SOLVED: 1, UNWINNABLE: 0}.get(result.status, ""),
+        len(result.moves),
+        result.nodes,
+        round(time.perf_counter() - start, 4),
+    )
+
+
+def analyze(seeds, draw=3, passes=1000, workers=None, chunksize=64, max_nodes=200000, time_limit=2.0):
+    """Resolve os jogos em paralelo; devolve os resultados à medida que ficam prontos."""
+    tasks = ((seed, draw, passes, max_nodes, time_limit) for seed in seeds)
+    with multiprocessing.Pool(workers) as pool:
+        yield from pool.imap_unordered(analyze_deal, tasks, chunksize)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analisa em lote se os jogos gerados por seed são ganháveis.")
+    parser.add_argument("--count", type=int, default=1000, help="número de jogos a analisar")
+    parser.add_argument("--start-seed", type=int, default=0, help="primeira seed")
+    parser.add_argument("--draw", type=int, choices=(1, 3), default=3, help="cartas tiradas de cada vez")
+    parser.add_argument("--passes", type=int, default=1000, help="passagens permitidas pelo baralho")
+    parser.add_argument("--workers", type=int, default=None, help="processos (por omissão, um por CPU)")
+    parser.add_argument("--chunksize", type=int, default=64, help="jogos enviados a cada processo de uma vez")
+    parser.add_argument("--max-nodes", type=int, default=200000, help="nós por jogo")
+    parser.add_argument("--time-limit", type=float, default=2.0, help="segundos por jogo")
+    parser.add_argument("--output", default="deals.csv", help="ficheiro CSV de saída")
+    parser.add_argument("--progress", type=int, default=1000, help="mostrar o progresso a cada N jogos")
+    args = parser.parse_args(argv)
+
+    seeds = range(args.start_seed, args.start_seed + args.count)
+    start = time.perf_counter()
+    done = 0
+    winnable = 0
+    decided = 0
+    with open(args.output, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(FIELDS)
+        for row in analyze(seeds, args.draw, args.passes, args.workers, args.chunksize, args.max_nodes, args.time_limit):
+            writer.writerow(row)
+            done += 1
+            winnable += row[4] == 1
+            decided += row[4] != ""
+            if done % args.progress == 0 or done == args.count:
+                elapsed = time.perf_counter() - start
+                print(
+                    f"{done}/{args.count} jogos, {winnable / done:.1%} ganháveis, "
+                    f"{(done - decided) / done:.1%} por decidir, {done / elapsed:.1f} jogos/s",
+                    file=sys.stderr,
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,453 @@
+"""Benchmarks dos caminhos críticos do jogo, sem browser.
+
+O ``Solitaire`` corre numa página do Flet ligada a um cliente falso que
+processa e conta as mensagens que seriam enviadas ao browser. O resultado é
+um JSON com as métricas e, se algum limite for ultrapassado, a lista das
+falhas e o código de saída 1:
+
+    python bench.py --output bench_output.txt
+    python bench.py --threshold place_ms=0.5 --thresholds limites.json
+"""
+import argparse
+import asyncio
+import contextlib
+import gc
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+from flet.core.local_connection import LocalConnection
+from flet.core.protocol import PageCommandsBatchResponsePayload
+import flet as ft
+
+from game import FOUNDATION, OP_MOVE, STOCK, TABLEAU
+from settings import Settings
+from solitaire import Solitaire
+import journal
+import main as app
+
+# Limites por omissão: tempos em milissegundos, memória e tráfego em bytes
+DEFAULT_THRESHOLDS = {
+    "first_interactive_ms": 150.0,
+    "deal_ms": 60.0,
+    "place_ms": 10.0,
+    "drag_ms": 0.5,
+    "drag_updates_per_frame": 2.0,
+    "undo_ms": 10.0,
+    "restore_ms": 20.0,
+    "save_ms": 20.0,
+    "load_ms": 20.0,
+    "resume_ms": 30.0,
+    "journal_bytes_per_action": 64,
+    "journal_recovery_errors": 0,
+    "history_bytes": 100000,
+    "session_bytes": 600000,
+    "updates_per_action": 2.5,
+    "bytes_per_action": 20000,
+}
+
+
+class RecordingConnection(LocalConnection):
+    """Cliente falso: aplica os comandos como o servidor do Flet e conta o tráfego.
+
+    Responde também ao ``client_storage`` da página, com um dicionário.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.batches = 0
+        self.bytes_sent = 0
+        self.page = None
+        self.storage = {}
+
+    def send_commands(self, session_id, commands):
+        results = []
+        for command in commands:
+            if command.name == "invokeMethod":
+                self.invoke_method(*command.values[:2], command.attrs)
+                continue
+            result, _ = self._process_command(command)
+            if result:
+                results.append(result)
+            self.bytes_sent += len(json.dumps(command, default=vars))
+        self.batches += 1
+        return PageCommandsBatchResponsePayload(results=results, error="")
+
+    def send_command(self, session_id, command):
+        return self.send_commands(session_id, [command])
+
+    def invoke_method(self, method_id, method_name, arguments):
+        result = None
+        if method_name == "clientStorage:get":
+            value = self.storage.get(arguments["key"])
+            result = None if value is None else json.dumps(value)
+        elif method_name == "clientStorage:set":
+            self.storage[arguments["key"]] = arguments["value"]
+            result = "true"
+        data = json.dumps({"method_id": method_id, "result": result, "error": None})
+        self.page.event_handlers["invoke_method_result"](SimpleNamespace(data=data))
+
+
+def new_page(connection=None):
+    connection = connection or RecordingConnection()
+    page = ft.Page(connection, "bench", asyncio.new_event_loop())
+    connection.page = page
+    return page
+
+
+def new_game(settings, seed):
+    """Cria um jogo numa página ligada ao cliente falso; devolve o jogo e a ligação."""
+    connection = RecordingConnection()
+    page = new_page(connection)
+    solitaire = Solitaire(settings, lambda: None, seed=seed)
+    page.add(solitaire)
+    return solitaire, connection
+
+
+def drag_event(card, dx=0.0, dy=0.0):
+    return SimpleNamespace(control=card, delta_x=dx, delta_y=dy)
+
+
+def play(solitaire, rng, actions):
+    """Faz ``actions`` ações aleatórias pelos mesmos eventos que o jogador usa."""
+    game = solitaire.game
+    for _ in range(actions):
+        moves = game.legal_moves()
+        if not moves:
+            return
+        src, dst, count = rng.choice(moves)
+        if src == dst:
+            solitaire.slots[src].get_top_card().click(None)
+        elif src == STOCK:
+            solitaire.stock.get_top_card().click(None)
+        elif dst == STOCK:
+            solitaire.stock.click(None)
+        else:
+            card = solitaire.cards[game.piles[src][-count]]
+            event = drag_event(card)
+            card.start_drag(event)
+            card.top = solitaire.slots[dst].upper_card_top()
+            card.left = solitaire.slots[dst].left
+            card.drop(event)
+
+
+def card_move(game):
+    """Uma jogada de cartas legal (nem tiragens nem viragens), se houver."""
+    for move in game.legal_moves():
+        src, dst, _ = move
+        if src != dst and STOCK not in (src, dst) and src not in FOUNDATION:
+            return move
+    return None
+
+
+def mean_ms(samples):
+    return round(statistics.fmean(samples) * 1000, 4) if samples else None
+
+
+def bench_deal(settings, games):
+    samples = []
+    for seed in range(games):
+        page = new_page()
+        solitaire = Solitaire(settings, lambda: None, seed=seed)
+        start = time.perf_counter()
+        page.add(solitaire)  # did_mount: create_slots, create_card_deck e deal_cards
+        samples.append(time.perf_counter() - start)
+    return {"deal_ms": mean_ms(samples)}
+
+
+def bench_startup(settings, games):
+    """Tempo do ``main`` desde a ligação da sessão até o jogo poder ser jogado."""
+    samples = []
+    for _ in range(games):
+        page = new_page()
+        samples.append(app.main(page, settings))
+        page.solitaire.end_journal()  # A sessão seguinte começa um jogo novo
+    return {"first_interactive_ms": mean_ms(samples)}
+
+
+def bench_place(settings, games):
+    samples = []
+    for seed in range(games):
+        solitaire, _ = new_game(settings, seed)
+        game = solitaire.game
+        for _ in range(200):
+            move = card_move(game)
+            if move is None:
+                if not game.piles[STOCK] and not game.can_recycle():
+                    break
+                if game.piles[STOCK]:
+                    solitaire.stock.get_top_card().click(None)
+                else:
+                    solitaire.stock.click(None)
+                continue
+            src, dst, count = move
+            card = solitaire.cards[game.piles[src][-count]]
+            start = time.perf_counter()
+            card.place(solitaire.slots[dst])
+            samples.append(time.perf_counter() - start)
+            top = solitaire.slots[src].get_top_card()
+            if src in TABLEAU and top is not None and not top.face_up:
+                top.turn_face_up()
+            solitaire.save_state()
+    return {"place_ms": mean_ms(samples)}
+
+
+def bench_drag(settings, games, events=200, event_ms=8.0):
+    """Tempo de cada evento de arrasto e atualizações enviadas por frame.
+
+    Os eventos chegam a cada ``event_ms`` de um relógio falso, mais depressa
+    que o ``drag_frame_ms`` do cliente, como um cliente que não junta os eventos.
+    """
+    samples = []
+    per_frame = []
+    for seed in range(games):
+        solitaire, _ = new_game(settings, seed)
+        clock = [0.0]
+        solitaire.now = lambda: clock[0]
+        card = solitaire.cards[solitaire.game.piles[TABLEAU[-1]][-1]]
+        card.start_drag(drag_event(card))
+        start = time.perf_counter()
+        for _ in range(events):
+            clock[0] += event_ms / 1000
+            card.drag(drag_event(card, 1.0, 1.0))
+        samples.append((time.perf_counter() - start) / events)
+        solitaire.end_drag()
+        if settings.drag_frame_ms:
+            per_frame.append(solitaire.drag_updates / (events * event_ms / settings.drag_frame_ms))
+        solitaire.bounce_back(card.get_cards_to_move())
+    return {
+        "drag_ms": mean_ms(samples),
+        "drag_updates_per_frame": round(statistics.fmean(per_frame), 3) if per_frame else None,
+    }
+
+
+def bench_undo_and_history(settings, games, actions):
+    undo_samples = []
+    history_bytes = []
+    for seed in range(games):
+        solitaire, _ = new_game(settings, seed)
+        play(solitaire, random.Random(seed), actions)
+        entries = solitaire.history.actions
+        history_bytes.append(sys.getsizeof(entries) + sum(sys.getsizeof(entry) for entry in entries))
+        while len(solitaire.history):
+            start = time.perf_counter()
+            solitaire.undo()
+            undo_samples.append(time.perf_counter() - start)
+    return {"undo_ms": mean_ms(undo_samples), "history_bytes": round(statistics.fmean(history_bytes))}
+
+
+def bench_session_memory(settings, games):
+    """Memória de cada sessão aberta: página, jogo, controles e estado."""
+    new_game(settings, games)  # Os dados partilhados pelo processo ficam fora da medição
+    gc.collect()
+    tracemalloc.start()
+    try:
+        sessions = [new_game(settings, seed) for seed in range(games)]
+        gc.collect()
+        allocated, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"session_bytes": round(allocated / len(sessions))}
+
+
+def bench_restore(settings, games, actions):
+    samples = []
+    for seed in range(games):
+        solitaire, _ = new_game(settings, seed)
+        state = solitaire.get_state()
+        play(solitaire, random.Random(seed), actions)
+        start = time.perf_counter()
+        solitaire.restore_state(state)
+        samples.append(time.perf_counter() - start)
+    return {"restore_ms": mean_ms(samples)}
+
+
+def bench_save_load(settings, games, actions):
+    save_samples = []
+    load_samples = []
+    with tempfile.TemporaryDirectory() as directory:
+        settings = Settings(**{**vars(settings), "save_dir": directory})
+        for seed in range(games):
+            solitaire, _ = new_game(settings, seed)
+            play(solitaire, random.Random(seed), actions)
+            start = time.perf_counter()
+            solitaire.save_game().result()  # Até o ficheiro estar escrito
+            save_samples.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            solitaire.load_game()
+            load_samples.append(time.perf_counter() - start)
+    return {"save_ms": mean_ms(save_samples), "load_ms": mean_ms(load_samples)}
+
+
+def bench_journal(settings, games, actions):
+    """Bytes do diário por ação e tempo para retomar um jogo depois de a sessão fechar."""
+    samples = []
+    written = 0
+    done = 0
+    for seed in range(games):
+        solitaire, _ = new_game(settings, seed)
+        play(solitaire, random.Random(seed), actions)
+        done += len(solitaire.history)
+        solitaire.journal.writer.flush()
+        written += os.path.getsize(solitaire.journal.log_path())
+        solitaire.will_unmount()  # O diário fica para ser retomado
+        page = new_page()
+        resumed = Solitaire(settings, lambda: None, journal_id=solitaire.journal_id)
+        start = time.perf_counter()
+        page.add(resumed)
+        samples.append(time.perf_counter() - start)
+        resumed.end_journal()
+    return {
+        "resume_ms": mean_ms(samples),
+        "journal_bytes_per_action": round(written / done) if done else None,
+    }
+
+
+def check_journal_recovery(settings, games, actions):
+    """Jogos retomados do diário que não ficam iguais aos que a sessão deixou, incluindo as jogadas contadas.
+
+    Cada jogo tem "desfazer" pelo meio e no fim, e checkpoints frequentes,
+    para os desfazer atravessarem checkpoints; o diário acaba com uma ação
+    cortada a meio, como se o processo tivesse parado durante a escrita.
+    """
+    settings = Settings(**{**vars(settings), "journal_checkpoint_every": 7})
+    errors = 0
+    for seed in range(games):
+        solitaire, _ = new_game(settings, seed)
+        rng = random.Random(seed)
+        for action in range(actions):
+            if action == actions // 2:
+                solitaire.time_remaining -= 1 + seed  # O tempo restante também é retomado
+            if len(solitaire.history) and rng.random() < 0.2:
+                solitaire.undo()
+            else:
+                play(solitaire, rng, 1)
+        for _ in range(2):
+            solitaire.undo()  # O diário acaba com "desfazer", às vezes de ações anteriores ao checkpoint
+        game = solitaire.game
+        expected = (
+            solitaire.get_state(), solitaire.score, solitaire.time_remaining, game.passes_remaining,
+            solitaire.played()[1],
+        )
+        # Uma ação sem o fim, e uma operação com só metade dos bytes
+        torn = game.copy()
+        torn.journal = bytearray()
+        moves = torn.legal_moves()
+        if moves:
+            torn.apply(moves[0])
+        solitaire.journal.writer.flush()
+        with open(solitaire.journal.log_path(), "ab") as file:
+            file.write(bytes(torn.journal) + bytes((OP_MOVE, TABLEAU[0])))
+        solitaire.journal.close()  # O processo parou: não há checkpoint ao fechar a sessão
+
+        resumed = Solitaire(settings, lambda: None, journal_id=solitaire.journal_id)
+        new_page().add(resumed)
+        got = (
+            resumed.get_state(), resumed.score, resumed.time_remaining, resumed.game.passes_remaining,
+            resumed.played()[1],
+        )
+        errors += got != expected or resumed.journal_id != solitaire.journal_id
+        resumed.end_journal()
+    return {"journal_recovery_errors": errors}
+
+
+def bench_traffic(settings, games, actions):
+    """Atualizações e bytes enviados ao cliente por ação do jogador."""
+    updates = 0
+    sent = 0
+    done = 0
+    for seed in range(games):
+        solitaire, connection = new_game(settings, seed)
+        batches, bytes_sent = connection.batches, connection.bytes_sent
+        rng = random.Random(seed)
+        for _ in range(actions):
+            history = len(solitaire.history)
+            play(solitaire, rng, 1)
+            if len(solitaire.history) == history:
+                break
+            done += 1
+        updates += connection.batches - batches
+        sent += connection.bytes_sent - bytes_sent
+    return {
+        "updates_per_action": round(updates / done, 3) if done else None,
+        "bytes_per_action": round(sent / done) if done else None,
+    }
+
+
+def run(games=5, actions=100, settings=None):
+    settings = settings or Settings(stats_db=None)
+    metrics = {}
+    # O jogo escreve mensagens com print; não se misturam com o JSON
+    with (
+        open(os.devnull, "w") as devnull,
+        contextlib.redirect_stdout(devnull),
+        tempfile.TemporaryDirectory() as journal_dir,
+    ):
+        # Os diários dos jogos medidos não se misturam com os jogos por terminar
+        settings = Settings(**{**vars(settings), "journal_dir": journal_dir})
+        metrics.update(bench_startup(settings, games))
+        metrics.update(bench_deal(settings, games))
+        metrics.update(bench_place(settings, games))
+        metrics.update(bench_drag(settings, games))
+        metrics.update(bench_undo_and_history(settings, games, actions))
+        metrics.update(bench_session_memory(settings, games))
+        metrics.update(bench_restore(settings, games, actions))
+        metrics.update(bench_save_load(settings, games, actions))
+        metrics.update(bench_journal(settings, games, actions))
+        metrics.update(check_journal_recovery(settings, games, actions))
+        metrics.update(bench_traffic(settings, games, actions))
+        journal.open_writer().flush()  # Antes de apagar a pasta dos diários
+    return metrics
+
+
+def check(metrics, thresholds):
+    """Lista as métricas acima do limite."""
+    return [
+        {"metric": name, "value": metrics[name], "threshold": limit}
+        for name, limit in thresholds.items()
+        if metrics.get(name) is not None and metrics[name] > limit
+    ]
+
+
+def parse_threshold(text):
+    name, _, value = text.partition("=")
+    if name not in DEFAULT_THRESHOLDS or not value:
+        raise argparse.ArgumentTypeError(f"limite inválido: {text}")
+    return name, float(value)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mede os caminhos críticos do jogo.")
+    parser.add_argument("--games", type=int, default=5, help="jogos por benchmark")
+    parser.add_argument("--actions", type=int, default=100, help="ações por jogo")
+    parser.add_argument("--draw", type=int, choices=(1, 3), default=3, help="cartas tiradas de cada vez")
+    parser.add_argument("--thresholds", help="ficheiro JSON com limites {métrica: valor}")
+    parser.add_argument("--threshold", type=parse_threshold, action="append", default=[], help="métrica=valor")
+    parser.add_argument("--output", help="ficheiro de saída (por omissão, a saída padrão)")
+    args = parser.parse_args(argv)
+
+    thresholds = dict(DEFAULT_THRESHOLDS)
+    if args.thresholds:
+        with open(args.thresholds) as file:
+            thresholds.update(json.load(file))
+    thresholds.update(args.threshold)
+
+    metrics = run(args.games, args.actions, Settings(waste_size=args.draw, stats_db=None))
+    failures = check(metrics, thresholds)
+    report = json.dumps({"metrics": metrics, "thresholds": thresholds, "failures": failures}, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(report + "\n")
+    else:
+        print(report)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,176 +1,300 @@
 import flet as ft
+from collections import namedtuple
+from card_assets import face_src, load_atlas
+from game import CARD_NAMES, DECK_SIZE, NO_PILE, RANKS, STOCK, SUITES
+from metrics import timed
+
+CardData = namedtuple("CardData", "suite rank name color face_src")
+
+# Dados de cada carta, partilhados por todas as sessões do processo
+CARD_DATA = tuple(
+    CardData(SUITES[card // 13], RANKS[card % 13], CARD_NAMES[card], SUITES[card // 13].color, face_src(card))
+    for card in range(DECK_SIZE)
+)
+
+
+def create_card_image(src, atlas):
+    """Cria a imagem de uma carta; devolve a imagem e o controle que a mostra.
+
+    Com o atlas, o controle mostra a parte do atlas com a imagem da carta e
+    mudar de imagem só muda a posição; sem ele, cada imagem é um ficheiro.
+    """
+    if atlas is None:
+        # A própria imagem tem o tamanho e os cantos da carta, sem um Container à volta
+        image = ft.Image(src=src, width=70, height=100, border_radius=ft.border_radius.all(6))
+        return image, image
+    image = ft.Image(src=atlas["src"], width=atlas["width"], height=atlas["height"], fit=ft.ImageFit.FILL)
+    show_card_image(image, atlas, src)
+    return image, ft.Container(
+        width=70,
+        height=100,
+        border_radius=ft.border_radius.all(6),
+        clip_behavior=ft.ClipBehavior.ANTI_ALIAS,
+        content=ft.Stack([image], width=70, height=100),
+    )
+
+
+def show_card_image(image, atlas, src):
+    """Mostra na imagem criada por ``create_card_image`` a imagem com o caminho original ``src``."""
+    if atlas is None:
+        image.src = src
+    else:
+        x, y = atlas["cells"][src]
+        image.left = -x
+        image.top = -y
+
+
+class CardControls:
+    """Os controles das cartas, indexados pelo identificador, criados quando são usados pela primeira vez."""
+
+    def __init__(self, solitaire):
+        self.solitaire = solitaire
+        self.cards = [None] * DECK_SIZE
+
+    def __len__(self):
+        return DECK_SIZE
+
+    def __getitem__(self, card_id):
+        card = self.cards[card_id]
+        if card is None:
+            card = self.cards[card_id] = Card(solitaire=self.solitaire, card_id=card_id)
+        return card
+
+    def get(self, card_id):
+        """O controle da carta, ou None se ainda não foi criado."""
+        return self.cards[card_id]
+
+    def created(self):
+        """Os controles já criados."""
+        return [card for card in self.cards if card is not None]
+
 
 class Card(ft.GestureDetector):
-    def __init__(self, solitaire, suite, rank):
+    def __init__(self, solitaire, card_id):
         super().__init__()
         self.solitaire = solitaire
-        self.suite = suite
-        self.rank = rank
-        self.face_up = False
-        self.slot = None
+        self.id = card_id  # Identificador da carta no estado do jogo
+        self.data = CARD_DATA[card_id]
 
         self.mouse_cursor = ft.MouseCursor.MOVE
-        self.drag_interval = 5
+        # O cliente junta os eventos de arrasto ao ritmo de um frame
+        self.drag_interval = max(5, self.solitaire.settings.drag_frame_ms)
         self.on_pan_update = self.drag
         self.on_pan_start = self.start_drag
         self.on_pan_end = self.drop
         self.on_tap = self.click
         self.on_double_tap = self.doubleclick
-        self.content = ft.Container(
-            width=70,
-            height=100,
-            border_radius=ft.border_radius.all(6),
-            content=ft.Image(src=self.solitaire.settings.card_back)  # Usa o design das configurações
-        )
+        self.attached = False  # Se está na árvore de controles do tabuleiro
+        self.animate_position = self.solitaire.animation  # O cliente anima as mudanças de lugar
+        self.atlas = load_atlas(self.solitaire.settings.card_atlas)
+        self.image, self.content = create_card_image(self.solitaire.settings.card_back, self.atlas)
+
+    @property
+    def suite(self):
+        return self.data.suite
+
+    @property
+    def rank(self):
+        return self.data.rank
+
+    @property
+    def face_up(self):
+        return bool(self.solitaire.game.face_up[self.id])
+
+    @property
+    def slot(self):
+        pile = self.solitaire.game.location[self.id]
+        if pile == NO_PILE:
+            return None
+        return self.solitaire.slots[pile]
+
+    def show_image(self, src):
+        """Mostra a imagem com o caminho original ``src``, do atlas se houver."""
+        show_card_image(self.image, self.atlas, src)
+
+    def render_face(self):
+        """Mostra a frente ou as costas da carta conforme o estado do jogo."""
+        if self.face_up:
+            self.show_image(self.data.face_src)
+        else:
+            self.show_image(self.solitaire.settings.card_back)  # Usa o design das configurações
 
     def turn_face_up(self):
-        self.face_up = True
-        self.content.content.src = f"/images/{self.rank.name}_{self.suite.name}.svg"
-        self.solitaire.update()
+        # A carta é redesenhada pelo evento CardRevealed
+        self.solitaire.game.set_face(self.id, True)
 
     def turn_face_down(self):
-        self.face_up = False
-        self.content.content.src = self.solitaire.settings.card_back  # Usa o design das configurações
+        self.solitaire.game.set_face(self.id, False)
+        self.solitaire.render_card(self)
         self.solitaire.update()
 
     def can_be_moved(self):
-        if self.face_up and self.slot.type != 'waste':
-            return True
-        if self.slot.type == 'waste' and len(self.solitaire.waste.pile)-1 == self.solitaire.waste.pile.index(self):
-            return True
-        return False
+        return self.solitaire.game.can_be_moved(self.id)
 
     def start_drag(self, e: ft.DragStartEvent):
-        #if e.control.face_up:
-        if self.can_be_moved():
-            cards_to_drag = self.get_cards_to_move()
-            self.solitaire.move_on_top(cards_to_drag)
-            # remember card original position to return it back if needed
-            self.solitaire.current_top = e.control.top
-            self.solitaire.current_left = e.control.left
-            self.solitaire.update()
+        with self.solitaire.batch():
+            #if e.control.face_up:
+            if self.can_be_moved():
+                cards_to_drag = self.get_cards_to_move()
+                self.solitaire.move_on_top(cards_to_drag)
+                for card in cards_to_drag:
+                    card.animate_position = None  # Durante o arrasto as cartas seguem o cursor sem atraso
+                # remember card original position to return it back if needed
+                self.solitaire.current_top = e.control.top
+                self.solitaire.current_left = e.control.left
+                self.solitaire.drag_updates = 0
+                self.solitaire.last_drag_update = self.solitaire.now()
+                self.solitaire.update()
 
+    @timed("drag")
     def drag(self, e: ft.DragUpdateEvent):
         if self.can_be_moved():
+            cards_to_drag = self.get_cards_to_move()
             i = 0
-            for card in self.get_cards_to_move():
+            for card in cards_to_drag:
                 card.top = max(0, self.top + e.delta_y)
                 if card.slot.type == "tableau":
                     card.top += i * self.solitaire.card_offset
                 card.left = max(0, self.left + e.delta_x)
                 i += 1
-            self.solitaire.update()
+            # Só envia as cartas arrastadas
+            self.solitaire.send_drag(cards_to_drag)
 
     def drop(self, e: ft.DragEndEvent):
-        if self.can_be_moved():
-            cards_to_drag = self.get_cards_to_move()
-            slots = self.solitaire.tableau + self.solitaire.foundation
-            # check if card is close to any of the tableau or foundation slots
-            for slot in slots:
-                # compare with top and left position of the top card in the slot pile
-                if (
-                    abs(self.top - slot.upper_card_top()) < 40
-                    and abs(self.left - slot.left) < 40
-                ):
-                    if (
-                        slot.type == "tableau"
-                        and self.solitaire.check_tableau_rules(
-                            self, slot.get_top_card()
-                        )
-                    ) or (
-                        slot.type == "foundation"
-                        and len(cards_to_drag) == 1
-                        and self.solitaire.check_foundation_rules(
-                            self, slot.get_top_card()
-                        )
+        self.solitaire.end_drag()  # A posição final vai com a jogada
+        with self.solitaire.batch():
+            if self.can_be_moved():
+                cards_to_drag = self.get_cards_to_move()
+                # check if card is close to any of the tableau or foundation slots
+                for slot in self.solitaire.drop_targets.find(self.top, self.left):
+                    if self.solitaire.game.can_move(
+                        self.slot.index, slot.index, len(cards_to_drag)
                     ):
 
                         old_slot = self.slot
-                        for card in cards_to_drag:
-                            card.place(slot)
+                        self.place(slot)
                         # reveal top card in old tableau slot if exists
-                        if len(old_slot.pile) > 0 and old_slot.type == "tableau":
+                        if self.solitaire.game.piles[old_slot.index] and old_slot.type == "tableau":
                             old_slot.get_top_card().turn_face_up()
                         elif old_slot.type == 'waste':
                             self.solitaire.display_waste()
-                        self.solitaire.update()
+                        self.solitaire.save_state()
+                        self.solitaire.auto_moves()
+                        # As cartas alteradas já foram marcadas pelos eventos
 
                         return
 
-            # return card to original position
-            self.solitaire.bounce_back(cards_to_drag)
-            self.solitaire.update()
+                # return card to original position
+                self.solitaire.bounce_back(cards_to_drag)
+                self.solitaire.update()
 
     def doubleclick(self, e):
-        if self.slot.type in ("waste", "tableau"):
-            if self.face_up:
-                #self.move_on_top(self.solitaire.controls, [self])
-                self.solitaire.move_on_top([self])
-                old_slot = self.slot
-                for slot in self.solitaire.foundation:
-                    if self.solitaire.check_foundation_rules(self, slot.get_top_card()):
-                        # if True:
-                        self.place(slot)
-                        #if len(old_slot.pile) > 0:
-                            #old_slot.get_top_card().turn_face_up()
-                        # self.solitaire.display_waste()
-                        self.solitaire.update()
-                        return
+        with self.solitaire.batch():
+            if self.slot.type in ("waste", "tableau"):
+                game = self.solitaire.game
+                src = self.slot.index
+                # Só a carta do topo vai para a fundação, sozinha
+                move = game.foundation_move(src) if game.top(src) == self.id else None
+                if move is not None:
+                    self.solitaire.move_on_top([self])
+                    self.place(self.solitaire.slots[move[1]])
+                    self.solitaire.save_state()
+                    self.solitaire.auto_moves()
+                    self.solitaire.update()
 
     def click(self, e):
-        if self.slot.type == "stock":
-            # first, set the current top 3 cards to invisible
-            for card in self.solitaire.waste.get_top_three_cards():
-                card.visible = False
-
-            for i in range(
-                min(self.solitaire.settings.waste_size, len(self.solitaire.stock.pile))
-            ):
-                top_card = self.solitaire.stock.pile[-1]
-                #self.move_on_top(self.solitaire.controls, [top_card])
-                #self.solitaire.move_on_top([top_card])
-                top_card.place(self.solitaire.waste)
-                top_card.turn_face_up()
-            self.solitaire.display_waste()
-            self.solitaire.update()
-
-        if self.slot.type == "tableau":
-            if self.face_up == False and len(self.slot.pile)-1 == self.slot.pile.index(self):
-                self.turn_face_up()
+        with self.solitaire.batch():
+            if self.slot.type == "stock":
+                # first, set the current top 3 cards to invisible
+                for card in self.solitaire.waste.get_top_three_cards():
+                    card.visible = False
+
+                for card_id in self.solitaire.game.draw():
+                    top_card = self.solitaire.cards[card_id]
+                    self.solitaire.render_card(top_card)
+                self.solitaire.save_state()
+                self.solitaire.auto_moves()
+                self.solitaire.display_waste()
+                self.solitaire.update()
 
+            if self.slot.type == "tableau":
+                if self.face_up == False and self.solitaire.game.top(self.slot.index) == self.id:
+                    self.turn_face_up()
+                    self.solitaire.save_state()
+                    self.solitaire.auto_moves()
+
+    @timed("place")
     def place(self, slot):
-        self.top = slot.top
-        self.left = slot.left
-        if slot.type == "tableau":
-            self.top += self.solitaire.card_offset * len(slot.pile)
+        # Move a carta (e as que estão por cima dela) no estado do jogo; o desenho,
+        # a pontuação e a vitória ficam com quem subscreve o evento CardMoved
+        game = self.solitaire.game
+        src = self.slot.index
+        game.move(src, slot.index, len(game.piles[src]) - game.index(self.id))
 
-        # Remove a carta do slot atual, se existir
+    def get_cards_to_move(self):
+        """returns list of cards that will be dragged together, starting with the current card"""
         if self.slot is not None:
-            self.slot.pile.remove(self)
+            game = self.solitaire.game
+            cards = self.solitaire.cards
+            return [cards[card_id] for card_id in game.piles[game.location[self.id]][game.position[self.id]:]]
 
-        # Define o novo slot da carta
-        self.slot = slot
+        return [self]
 
-        # Adiciona a carta ao novo slot
-        slot.pile.append(self)
 
-        # Salva o estado atual no histórico
-        self.solitaire.save_state()
+class CardPile(ft.Container):
+    """As cartas viradas para baixo de uma pilha, desenhadas como uma só carta com a contagem.
 
-        # Verifica se o jogador venceu
-        if self.solitaire.check_if_you_won():
-            self.solitaire.on_win()
+    Com as pilhas compactas, estas cartas não têm controles na página; a
+    carta só entra na árvore quando fica visível.
+    """
 
-        # 10 pontos por carta na fundação
-        if slot.type == "foundation":
-            self.solitaire.update_score(10)
+    def __init__(self, solitaire, pile):
+        super().__init__()
+        self.solitaire = solitaire
+        self.index = pile  # Índice da pilha no estado do jogo
+        self.count = None  # Cartas mostradas da última vez
+        self.atlas = load_atlas(self.solitaire.settings.card_atlas)
+        self.back, face = create_card_image(self.solitaire.settings.card_back, self.atlas)
+        self.label = ft.Text(size=12, weight=ft.FontWeight.BOLD, color=ft.colors.WHITE)
+        badge = ft.Container(
+            self.label,
+            left=4,
+            top=4,
+            padding=ft.padding.symmetric(horizontal=4),
+            border_radius=ft.border_radius.all(4),
+            bgcolor=ft.colors.with_opacity(0.6, ft.colors.BLACK),
+        )
+        self.content = ft.Stack([face, badge], width=70, height=100)
+        self.width = 70
+        self.height = 100
+        self.visible = False
+        self.animate_position = self.solitaire.animation
+        self.on_click = self.click
 
-        # Atualiza a interface
-        self.solitaire.update()
+    def show_image(self, src):
+        show_card_image(self.back, self.atlas, src)
 
-    def get_cards_to_move(self):
-        """returns list of cards that will be dragged together, starting with the current card"""
-        if self.slot is not None:
-            return self.slot.pile[self.slot.pile.index(self):]
+    def refresh(self):
+        """Acompanha o estado do jogo; devolve True se a pilha mudou."""
+        count = self.solitaire.game.hidden_count(self.index)
+        if count == self.count:
+            return False
+        self.count = count
+        self.label.value = str(count)
+        self.visible = count > 0
+        self.place()
+        return True
 
-        return [self]
\ No newline at end of file
+    def place(self):
+        """Põe a pilha no seu lugar no tabuleiro."""
+        slot = self.solitaire.slots[self.index]
+        # No tableau fica no lugar da última carta escondida, por baixo da primeira virada para cima
+        self.top = slot.top if self.index == STOCK else slot.top + self.solitaire.card_offset * max(0, self.count - 1)
+        self.left = slot.left
+        self.animate_position = self.solitaire.animation
+
+    def click(self, e):
+        # Tira do baralho ou vira a carta do topo, como um clique na própria carta
+        card = self.solitaire.slots[self.index].get_top_card()
+        if card is not None:
+            card.click(e)
@@ -0,0 +1,121 @@
+"""Atlas das cartas: as 52 frentes e as 4 costas numa única imagem.
+
+Em vez de o browser pedir e rasterizar um SVG por carta, todas as imagens
+são desenhadas uma vez ao tamanho das cartas no tabuleiro e juntas num PNG
+com o hash do conteúdo no nome, que pode ficar em cache sem prazo:
+
+    python card_assets.py --scale 2
+
+Cria ``assets/cache/cards-<hash>.png`` e o manifesto ``assets/cache/cards.json``
+com a posição de cada imagem. Precisa do Pillow e, para as frentes em SVG,
+do cairosvg; sem o atlas, as cartas usam os ficheiros originais.
+"""
+import argparse
+import glob
+import hashlib
+import io
+import json
+import os
+
+from game import CARD_NAMES, DECK_SIZE
+
+CARD_WIDTH = 70
+CARD_HEIGHT = 100
+COLUMNS = 13
+ROWS = 5  # Uma linha por naipe e uma para as costas
+BACKS = 4
+
+_atlases = {}  # Manifestos carregados, partilhados por todas as sessões do processo
+
+
+def face_src(card):
+    return f"/images/{CARD_NAMES[card]}.svg"
+
+
+def back_src(index):
+    return f"/images/card_back{index}.png"
+
+
+def atlas_cells():
+    """Posição (x, y) no atlas de cada imagem, pelo caminho original."""
+    cells = {face_src(card): ((card % 13) * CARD_WIDTH, (card // 13) * CARD_HEIGHT) for card in range(DECK_SIZE)}
+    cells.update({back_src(index): (index * CARD_WIDTH, 4 * CARD_HEIGHT) for index in range(BACKS)})
+    return cells
+
+
+def rasterize(path, width, height):
+    from PIL import Image
+
+    if path.endswith(".svg"):
+        try:
+            import cairosvg
+        except (ImportError, OSError) as error:  # O cairosvg também falha sem a biblioteca cairo
+            raise RuntimeError("As frentes das cartas precisam do cairosvg para serem rasterizadas") from error
+        png = cairosvg.svg2png(url=path, output_width=width, output_height=height)
+        return Image.open(io.BytesIO(png)).convert("RGBA")
+    return Image.open(path).convert("RGBA").resize((width, height), Image.LANCZOS)
+
+
+def build_atlas(assets_dir="assets", scale=1):
+    """Cria o atlas e o manifesto; devolve o caminho do manifesto.
+
+    Com ``scale`` maior que 1 as imagens são desenhadas com mais pixels, para
+    ecrãs de alta densidade, mas o atlas continua a ser mostrado ao tamanho
+    das cartas.
+    """
+    from PIL import Image
+
+    width, height = CARD_WIDTH * scale, CARD_HEIGHT * scale
+    atlas = Image.new("RGBA", (COLUMNS * width, ROWS * height))
+    cells = atlas_cells()
+    for src, (x, y) in cells.items():
+        image = rasterize(os.path.join(assets_dir, src.lstrip("/")), width, height)
+        atlas.paste(image, (x * scale, y * scale))
+    output = io.BytesIO()
+    atlas.save(output, "PNG", optimize=True)
+    data = output.getvalue()
+
+    cache_dir = os.path.join(assets_dir, "cache")
+    os.makedirs(cache_dir, exist_ok=True)
+    name = f"cards-{hashlib.sha256(data).hexdigest()[:12]}.png"
+    for old in glob.glob(os.path.join(cache_dir, "cards-*.png")):
+        if os.path.basename(old) != name:
+            os.remove(old)
+    with open(os.path.join(cache_dir, name), "wb") as file:
+        file.write(data)
+
+    manifest = {
+        "src": f"/cache/{name}",
+        "width": COLUMNS * CARD_WIDTH,
+        "height": ROWS * CARD_HEIGHT,
+        "cells": {src: list(cell) for src, cell in cells.items()},
+    }
+    path = os.path.join(cache_dir, "cards.json")
+    with open(path, "w") as file:
+        json.dump(manifest, file)
+    return path
+
+
+def load_atlas(path):
+    """Lê o manifesto uma única vez por processo; devolve None se não existir."""
+    if path not in _atlases:
+        try:
+            with open(path) as file:
+                manifest = json.load(file)
+            manifest["cells"] = {src: tuple(cell) for src, cell in manifest["cells"].items()}
+            _atlases[path] = manifest
+        except FileNotFoundError:
+            _atlases[path] = None
+    return _atlases[path]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cria o atlas com as imagens das cartas.")
+    parser.add_argument("--assets", default="assets", help="pasta dos assets do Flet")
+    parser.add_argument("--scale", type=int, default=1, help="pixels por ponto (2 para ecrãs de alta densidade)")
+    args = parser.parse_args(argv)
+    print(build_atlas(args.assets, args.scale))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+import logging
+import threading
+import time
+
+
+class Scheduler:
+    """Um único thread que faz avançar os relógios de todos os jogos do processo.
+
+    Cada jogo regista uma função que é chamada uma vez por intervalo; o thread
+    só é criado quando o primeiro relógio é registado.
+    """
+
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self.clocks = set()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def add(self, callback):
+        with self.lock:
+            self.clocks.add(callback)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name="solitaire-clock", daemon=True)
+                self.thread.start()
+
+    def remove(self, callback):
+        with self.lock:
+            self.clocks.discard(callback)
+
+    def run(self):
+        next_tick = time.monotonic()
+        while True:
+            next_tick += self.interval
+            time.sleep(max(0.0, next_tick - time.monotonic()))
+            with self.lock:
+                clocks = list(self.clocks)
+            for callback in clocks:
+                try:
+                    callback()
+                except Exception:
+                    # Um jogo com erro não pode parar os relógios dos outros
+                    logging.exception("Erro no relógio do jogo")
+                    self.remove(callback)
+
+
+scheduler = Scheduler()  # Partilhado por todas as sessões do processo
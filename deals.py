@@ -0,0 +1,173 @@
+"""Biblioteca de jogos pré-analisados, num ficheiro de registos fixos.
+
+O ficheiro é aberto com ``mmap`` e nunca é lido por inteiro: o cabeçalho
+diz onde começa e quantos registos tem cada grupo (modo de tiragem, se o
+jogo tem solução e passagens pelo baralho), e escolher um jogo é só
+calcular um deslocamento.
+
+Formato (little-endian):
+
+    cabeçalho: b"KDL1", versão (u16), tamanho do registo (u16), grupos (u32)
+    grupo:     tiragem (u8), com solução (u8), passagens (u16),
+               deslocamento (u32), quantidade (u32)
+    registo:   seed (u32), flags (u8), dificuldade (u8), jogadas da solução (u16),
+               passagens (u16)
+
+As passagens acima de ``UNLIMITED_PASSES`` contam como ilimitadas, como no
+solver. Um jogo com solução com poucas passagens também a tem com mais, e
+um sem solução com muitas também não a tem com menos: cada pedido usa o
+grupo mais próximo que ainda garante a resposta.
+
+Para criar a biblioteca a partir da saída do ``analyze.py``:
+
+    python deals.py deals_draw1.csv deals_draw3.csv --output deals.bin
+"""
+import argparse
+import csv
+import datetime
+import hashlib
+import mmap
+import random
+import struct
+
+from solver import UNLIMITED_PASSES
+
+MAGIC = b"KDL1"
+VERSION = 2
+HEADER = struct.Struct("<4sHHI")
+GROUP = struct.Struct("<BBHII")
+RECORD = struct.Struct("<IBBHH")
+
+FLAG_WINNABLE = 1
+FLAG_DRAW_THREE = 2
+
+_libraries = {}  # Bibliotecas abertas, partilhadas por todas as sessões do processo
+
+
+def deal_passes(passes):
+    return min(int(passes), UNLIMITED_PASSES)
+
+
+def day_number(draw, passes, date=None):
+    """Número do dia, igual para todos os jogadores com as mesmas regras na mesma data."""
+    date = date or datetime.date.today()
+    key = f"{date.isoformat()}:{draw}:{deal_passes(passes)}"
+    return int.from_bytes(hashlib.sha256(key.encode()).digest()[:8], "little")
+
+
+def daily_seed(draw, passes, date=None):
+    """Jogo do dia sem biblioteca: a mesma seed para todos, sem garantia de solução."""
+    return day_number(draw, passes, date) % 2**32
+
+
+class DealLibrary:
+    """Acesso O(1) aos jogos da biblioteca, sem ler o ficheiro no arranque."""
+
+    def __init__(self, path):
+        with open(path, "rb") as file:
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, record_size, count = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+            raise ValueError(f"{path} não é uma biblioteca de jogos válida")
+        self.groups = {}  # (tiragem, com solução, passagens) -> (deslocamento, quantidade)
+        for index in range(count):
+            draw, winnable, passes, offset, size = GROUP.unpack_from(self.data, HEADER.size + index * GROUP.size)
+            self.groups[draw, bool(winnable), passes] = (offset, size)
+
+    def group(self, draw, passes, winnable):
+        """O grupo cujos jogos garantem a resposta com ``passes`` passagens."""
+        passes = deal_passes(passes)
+        if winnable:
+            usable = [key for key in self.groups if key[:2] == (draw, True) and key[2] <= passes]
+            key = max(usable, key=lambda key: key[2], default=None)
+        else:
+            usable = [key for key in self.groups if key[:2] == (draw, False) and key[2] >= passes]
+            key = min(usable, key=lambda key: key[2], default=None)
+        return self.groups.get(key, (0, 0))
+
+    def count(self, draw, passes, winnable=True):
+        return self.group(draw, passes, winnable)[1]
+
+    def get(self, draw, passes, winnable, index):
+        """Devolve (seed, dificuldade, jogadas da solução) do registo ``index`` do grupo."""
+        offset, count = self.group(draw, passes, winnable)
+        if not 0 <= index < count:
+            raise IndexError(index)
+        seed, _, difficulty, length, _ = RECORD.unpack_from(self.data, offset + index * RECORD.size)
+        return seed, difficulty, length
+
+    def random_seed(self, draw, passes, winnable=True, rng=random):
+        count = self.count(draw, passes, winnable)
+        if count == 0:
+            return None
+        return self.get(draw, passes, winnable, rng.randrange(count))[0]
+
+    def daily_seed(self, draw, passes, date=None):
+        """Jogo do dia: o mesmo para todos os jogadores com as mesmas regras na mesma data."""
+        count = self.count(draw, passes, True)
+        if count == 0:
+            return None
+        return self.get(draw, passes, True, day_number(draw, passes, date) % count)[0]
+
+    def close(self):
+        self.data.close()
+
+
+def open_library(path):
+    """Abre a biblioteca uma única vez por processo; devolve None se não existir."""
+    if path not in _libraries:
+        try:
+            _libraries[path] = DealLibrary(path)
+        except FileNotFoundError:
+            _libraries[path] = None
+    return _libraries[path]
+
+
+def build_library(rows, path):
+    """Escreve a biblioteca a partir das linhas do CSV do ``analyze.py``.
+
+    Os jogos que o solver não conseguiu decidir ficam de fora.
+    """
+    groups = {}
+    for row in rows:
+        if row["status"] not in ("solved", "unwinnable"):
+            continue
+        if "passes" not in row:
+            raise ValueError("CSV sem a coluna passes: volte a correr o analyze.py")
+        draw = int(row["draw"])
+        passes = deal_passes(row["passes"])
+        winnable = row["status"] == "solved"
+        flags = (FLAG_WINNABLE if winnable else 0) | (FLAG_DRAW_THREE if draw == 3 else 0)
+        # Dificuldade: ordem de grandeza do número de nós que o solver precisou
+        difficulty = min(255, int(row["nodes"]).bit_length())
+        length = min(0xFFFF, int(row["solution_length"]))
+        record = RECORD.pack(int(row["seed"]), flags, difficulty, length, passes)
+        groups.setdefault((draw, winnable, passes), []).append(record)
+
+    offset = HEADER.size + len(groups) * GROUP.size
+    table = []
+    for (draw, winnable, passes), records in sorted(groups.items()):
+        table.append(GROUP.pack(draw, winnable, passes, offset, len(records)))
+        offset += len(records) * RECORD.size
+    with open(path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, VERSION, RECORD.size, len(groups)))
+        file.writelines(table)
+        for _, records in sorted(groups.items()):
+            file.writelines(records)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cria a biblioteca de jogos a partir da saída do analyze.py.")
+    parser.add_argument("inputs", nargs="+", help="ficheiros CSV do analyze.py")
+    parser.add_argument("--output", default="deals.bin", help="ficheiro da biblioteca")
+    args = parser.parse_args(argv)
+
+    rows = []
+    for name in args.inputs:
+        with open(name, newline="") as file:
+            rows.extend(csv.DictReader(file))
+    build_library(rows, args.output)
+
+
+if __name__ == "__main__":
+    main()
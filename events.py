@@ -0,0 +1,33 @@
+"""Eventos do jogo e o barramento que os entrega a quem os subscreve.
+
+O ``Game`` emite os eventos das jogadas quando tem um barramento; a
+pontuação, a deteção de vitória, a interface e as estatísticas subscrevem
+só os tipos de que precisam. Distribuir, desfazer e restaurar um jogo não
+emitem eventos.
+"""
+from collections import namedtuple
+
+CardMoved = namedtuple("CardMoved", "src dst cards")  # ``cards``: as cartas movidas, de baixo para cima
+CardRevealed = namedtuple("CardRevealed", "card pile")
+StockRecycled = namedtuple("StockRecycled", "count passes_remaining")
+ScoreChanged = namedtuple("ScoreChanged", "score points")
+GameWon = namedtuple("GameWon", "score")
+
+
+class EventBus:
+    """Entrega cada evento, pela ordem de subscrição, às funções do seu tipo."""
+
+    __slots__ = ("handlers",)
+
+    def __init__(self):
+        self.handlers = {}
+
+    def subscribe(self, event_type, handler):
+        self.handlers.setdefault(event_type, []).append(handler)
+
+    def unsubscribe(self, event_type, handler):
+        self.handlers.get(event_type, []).remove(handler)
+
+    def emit(self, event):
+        for handler in self.handlers.get(type(event), ()):
+            handler(event)
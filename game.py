@@ -0,0 +1,450 @@
+"""Estado do jogo Klondike independente do Flet.
+
+As cartas são inteiros de 0 a 51 (``naipe * 13 + valor - 1``) e cada pilha é
+um ``array`` de bytes, de modo que simulações, validações e análises podem
+correr sem criar nenhum controle da interface.
+"""
+import random
+from array import array
+from collections import namedtuple
+
+from events import CardMoved, CardRevealed, StockRecycled
+
+# Dados imutáveis das cartas, criados uma vez por processo e partilhados por todas as sessões
+Suite = namedtuple("Suite", "name color")
+Rank = namedtuple("Rank", "name value")
+
+SUITES = (
+    Suite("hearts", "RED"),
+    Suite("diamonds", "RED"),
+    Suite("clubs", "BLACK"),
+    Suite("spades", "BLACK"),
+)
+RANKS = (
+    Rank("Ace", 1),
+    Rank("2", 2),
+    Rank("3", 3),
+    Rank("4", 4),
+    Rank("5", 5),
+    Rank("6", 6),
+    Rank("7", 7),
+    Rank("8", 8),
+    Rank("9", 9),
+    Rank("10", 10),
+    Rank("Jack", 11),
+    Rank("Queen", 12),
+    Rank("King", 13),
+)
+
+DECK_SIZE = 52
+
+# Nomes no formato usado pelos ficheiros de imagem e pelo JSON salvo
+CARD_NAMES = tuple(f"{rank}_{suite}" for suite, _ in SUITES for rank, _ in RANKS)
+CARD_IDS = {name: card for card, name in enumerate(CARD_NAMES)}
+
+# Índices das pilhas
+STOCK = 0
+WASTE = 1
+FOUNDATION = (2, 3, 4, 5)
+TABLEAU = (6, 7, 8, 9, 10, 11, 12)
+PILE_COUNT = 13
+PILE_TYPES = ("stock", "waste") + ("foundation",) * 4 + ("tableau",) * 7
+
+NO_PILE = 255  # Carta ainda não distribuída
+
+# Operações registadas no diário de alterações: (tipo, a, b, c)
+OP_MOVE = 0  # (OP_MOVE, origem, destino, quantidade)
+OP_DRAW = 1  # (OP_DRAW, quantidade, 0, 0)
+OP_RECYCLE = 2  # (OP_RECYCLE, quantidade, 0, 0)
+OP_FLIP = 3  # (OP_FLIP, carta, virada_para_cima, 0)
+
+
+def shuffled_deck(seed=None):
+    """Ordem das 52 cartas para um jogo; a mesma seed dá sempre o mesmo jogo."""
+    order = list(range(DECK_SIZE))
+    random.Random(seed).shuffle(order)
+    return order
+
+
+def card_suite(card):
+    return card // 13
+
+
+def card_value(card):
+    return card % 13 + 1
+
+
+def card_is_red(card):
+    return card < 26
+
+
+def can_place_on_foundation(card, top=None):
+    """Regra da fundação: Ás numa pilha vazia, senão mesmo naipe e valor seguinte."""
+    if top is None:
+        return card % 13 == 0
+    return card - top == 1 and card // 13 == top // 13
+
+
+def can_place_on_tableau(card, top=None):
+    """Regra do tableau: Rei numa coluna vazia, senão cor alternada e valor anterior."""
+    if top is None:
+        return card % 13 == 12
+    return (card < 26) != (top < 26) and top % 13 - card % 13 == 1
+
+
+def is_safe_for_foundation(card, levels):
+    """Uma carta pode ir para a fundação sem nunca fazer falta no tableau."""
+    value = card % 13 + 1
+    if value <= 2:
+        return True
+    if card < 26:
+        return levels[2] >= value - 1 and levels[3] >= value - 1
+    return levels[0] >= value - 1 and levels[1] >= value - 1
+
+
+class Game:
+    """Estado completo de uma partida com uma API de jogadas.
+
+    Uma jogada é um tuplo ``(origem, destino, quantidade)``. Do stock para o
+    waste é tirar cartas do baralho, do waste para o stock é reciclar o
+    baralho, e ``(pilha, pilha, 0)`` vira para cima a carta do topo da pilha.
+
+    ``location`` e ``position`` dizem, para cada carta, em que pilha está e
+    em que posição dessa pilha, para que encontrar uma carta seja O(1).
+
+    Quando ``journal`` é um ``bytearray``, cada alteração feita pelas jogadas
+    é acrescentada como uma operação de 4 bytes que pode ser desfeita com
+    ``revert``.
+
+    Quando ``events`` é um ``EventBus``, as jogadas emitem também os eventos
+    correspondentes (cartas movidas, cartas viradas, baralho reciclado).
+    """
+
+    __slots__ = ("piles", "face_up", "location", "position", "waste_size", "passes_remaining", "journal", "events")
+
+    def __init__(self, waste_size=3, deck_passes_allowed=1000):
+        self.piles = [array("B") for _ in range(PILE_COUNT)]
+        self.face_up = bytearray(DECK_SIZE)
+        self.location = bytearray([NO_PILE]) * DECK_SIZE
+        self.position = bytearray(DECK_SIZE)
+        self.waste_size = waste_size
+        self.passes_remaining = deck_passes_allowed
+        self.journal = None
+        self.events = None
+
+    def deal(self, order):
+        """Distribui as cartas pela ordem dada: 28 no tableau e o resto no stock."""
+        self.clear()
+        index = 0
+        for first in range(len(TABLEAU)):
+            for pile in TABLEAU[first:]:
+                self.place(order[index], pile)
+                index += 1
+        for pile in TABLEAU:
+            self.face_up[self.piles[pile][-1]] = 1
+        for card in order[index:]:
+            self.place(card, STOCK)
+
+    def clear(self):
+        """Retira todas as cartas das pilhas."""
+        for pile in self.piles:
+            del pile[:]
+        self.face_up[:] = bytes(DECK_SIZE)
+        self.location[:] = bytes([NO_PILE]) * DECK_SIZE
+
+    def load(self, piles, face_up):
+        """Substitui as pilhas e as faces pelas dadas, sem registar no diário.
+
+        Devolve as cartas cuja pilha, posição na pilha ou face mudou.
+        """
+        old_location = bytes(self.location)
+        old_position = bytes(self.position)
+        old_face_up = bytes(self.face_up)
+        self.clear()
+        for pile, cards in enumerate(piles):
+            self.stack(cards, pile)
+        self.face_up[:] = face_up
+        return [
+            card for card in range(DECK_SIZE)
+            if old_location[card] != self.location[card]
+            or old_position[card] != self.position[card]
+            or old_face_up[card] != self.face_up[card]
+        ]
+
+    def place(self, card, pile):
+        """Coloca uma carta no topo de uma pilha, sem verificar regras nem registar."""
+        current = self.location[card]
+        if current != NO_PILE:
+            cards = self.piles[current]
+            index = self.position[card]
+            del cards[index]
+            for above in cards[index:]:
+                self.position[above] -= 1
+        self.position[card] = len(self.piles[pile])
+        self.piles[pile].append(card)
+        self.location[card] = pile
+
+    def top(self, pile):
+        cards = self.piles[pile]
+        if cards:
+            return cards[-1]
+        return None
+
+    def index(self, card):
+        return self.position[card]
+
+    def hidden_count(self, pile):
+        """Número de cartas viradas para baixo na base da pilha."""
+        count = 0
+        for card in self.piles[pile]:
+            if self.face_up[card]:
+                break
+            count += 1
+        return count
+
+    def can_be_moved(self, card):
+        """Indica se a carta (e as que estão por cima) pode ser arrastada."""
+        pile = self.location[card]
+        if pile == WASTE:
+            return self.piles[WASTE][-1] == card
+        return pile != NO_PILE and bool(self.face_up[card])
+
+    def can_move(self, src, dst, count=1):
+        """Verifica se mover ``count`` cartas de ``src`` para ``dst`` é legal."""
+        cards = self.piles[src]
+        if count < 1 or count > len(cards) or src == dst:
+            return False
+        card = cards[-count]
+        if not self.can_be_moved(card):
+            return False
+        if dst in FOUNDATION:
+            return count == 1 and can_place_on_foundation(card, self.top(dst))
+        if dst in TABLEAU:
+            return can_place_on_tableau(card, self.top(dst))
+        return False
+
+    def move(self, src, dst, count=1):
+        """Move as ``count`` cartas do topo de ``src`` para ``dst``."""
+        cards = self.piles[src]
+        moved = cards[len(cards) - count:]
+        del cards[len(cards) - count:]
+        self.stack(moved, dst)
+        if self.journal is not None:
+            self.journal += bytes((OP_MOVE, src, dst, count))
+        if self.events is not None:
+            self.events.emit(CardMoved(src, dst, moved))
+        return moved
+
+    def stack(self, cards, pile):
+        """Põe as cartas no topo da pilha e atualiza onde cada uma está."""
+        target = self.piles[pile]
+        index = len(target)
+        target.extend(cards)
+        for card in cards:
+            self.location[card] = pile
+            self.position[card] = index
+            index += 1
+
+    def set_face(self, card, face_up):
+        """Vira a carta para cima ou para baixo."""
+        face_up = int(bool(face_up))
+        if self.face_up[card] == face_up:
+            return
+        self.face_up[card] = face_up
+        if self.journal is not None:
+            self.journal += bytes((OP_FLIP, card, face_up, 0))
+        if face_up and self.events is not None:
+            self.events.emit(CardRevealed(card, self.location[card]))
+
+    def reveal(self, pile):
+        """Vira para cima a carta do topo da pilha; devolve a carta virada."""
+        card = self.top(pile)
+        if card is None or self.face_up[card]:
+            return None
+        self.set_face(card, True)
+        return card
+
+    def draw(self):
+        """Passa até ``waste_size`` cartas do stock para o waste, viradas para cima."""
+        count = min(self.waste_size, len(self.piles[STOCK]))
+        moved = array("B")
+        for _ in range(count):
+            card = self.piles[STOCK].pop()
+            self.position[card] = len(self.piles[WASTE])
+            self.piles[WASTE].append(card)
+            self.location[card] = WASTE
+            self.face_up[card] = 1
+            moved.append(card)
+        if count and self.journal is not None:
+            self.journal += bytes((OP_DRAW, count, 0, 0))
+        return moved
+
+    def can_recycle(self):
+        return self.passes_remaining > 1
+
+    def recycle(self):
+        """Devolve o waste ao stock, virado para baixo e pela ordem original."""
+        self.passes_remaining -= 1
+        waste = self.piles[WASTE]
+        if self.journal is not None:
+            self.journal += bytes((OP_RECYCLE, len(waste), 0, 0))
+        waste.reverse()
+        self.stack(waste, STOCK)
+        for card in waste:
+            self.face_up[card] = 0
+        count = len(waste)
+        del waste[:]
+        if self.events is not None:
+            self.events.emit(StockRecycled(count, self.passes_remaining))
+
+    def revert(self, ops):
+        """Desfaz as operações de um delta do diário; devolve as pilhas alteradas."""
+        piles = self.piles
+        changed = set()
+        for i in range(len(ops) - 4, -1, -4):
+            kind, a, b, c = ops[i:i + 4]
+            if kind == OP_MOVE:
+                src, dst, count = a, b, c
+                cards = piles[dst]
+                moved = cards[len(cards) - count:]
+                del cards[len(cards) - count:]
+                self.stack(moved, src)
+                changed.update((src, dst))
+            elif kind == OP_DRAW:
+                for _ in range(a):
+                    card = piles[WASTE].pop()
+                    self.stack((card,), STOCK)
+                    self.face_up[card] = 0
+                changed.update((STOCK, WASTE))
+            elif kind == OP_RECYCLE:
+                stock = piles[STOCK]
+                moved = stock[len(stock) - a:]
+                del stock[len(stock) - a:]
+                moved.reverse()
+                self.stack(moved, WASTE)
+                for card in moved:
+                    self.face_up[card] = 1
+                self.passes_remaining += 1
+                changed.update((STOCK, WASTE))
+            elif kind == OP_FLIP:
+                self.face_up[a] = 1 - b
+                changed.add(self.location[a])
+        return changed
+
+    def legal_moves(self):
+        """Lista todas as jogadas legais na posição atual."""
+        moves = []
+        piles = self.piles
+        face_up = self.face_up
+        for pile in TABLEAU:
+            cards = piles[pile]
+            if cards and not face_up[cards[-1]]:
+                moves.append((pile, pile, 0))
+        sources = (WASTE,) + FOUNDATION + TABLEAU
+        for src in sources:
+            cards = piles[src]
+            if not cards:
+                continue
+            if src in TABLEAU:
+                counts = range(1, len(cards) + 1)
+            else:
+                counts = (1,)
+            for count in counts:
+                card = cards[-count]
+                if not face_up[card]:
+                    break
+                for dst in FOUNDATION:
+                    if count == 1 and dst != src and can_place_on_foundation(card, self.top(dst)):
+                        moves.append((src, dst, 1))
+                for dst in TABLEAU:
+                    if dst != src and can_place_on_tableau(card, self.top(dst)):
+                        moves.append((src, dst, count))
+        if piles[STOCK]:
+            moves.append((STOCK, WASTE, min(self.waste_size, len(piles[STOCK]))))
+        elif piles[WASTE] and self.can_recycle():
+            moves.append((WASTE, STOCK, len(piles[WASTE])))
+        return moves
+
+    def apply(self, move):
+        """Executa uma jogada no formato ``(origem, destino, quantidade)``."""
+        src, dst, count = move
+        if src == dst:
+            return self.reveal(src)
+        if src == STOCK and dst == WASTE:
+            return self.draw()
+        if src == WASTE and dst == STOCK:
+            return self.recycle()
+        if not self.can_move(src, dst, count):
+            raise ValueError(f"Jogada ilegal: {move}")
+        return self.move(src, dst, count)
+
+    def foundation_levels(self):
+        """Valor da carta mais alta já na fundação, por naipe."""
+        levels = [0, 0, 0, 0]
+        for pile in FOUNDATION:
+            top = self.top(pile)
+            if top is not None:
+                levels[top // 13] = top % 13 + 1
+        return levels
+
+    def foundation_move(self, src):
+        """Jogada da carta do topo de ``src`` para a fundação, se for possível."""
+        card = self.top(src)
+        if card is None or not self.face_up[card]:
+            return None
+        for dst in FOUNDATION:
+            if can_place_on_foundation(card, self.top(dst)):
+                return (src, dst, 1)
+        return None
+
+    def next_safe_move(self):
+        """Próxima carta que pode ir para a fundação sem fazer falta no tableau."""
+        levels = self.foundation_levels()
+        for src in (WASTE,) + TABLEAU:
+            move = self.foundation_move(src)
+            if move is not None and is_safe_for_foundation(self.top(src), levels):
+                return move
+        return None
+
+    def autocomplete_moves(self):
+        """Jogadas que terminam o jogo, se já estiver resolvido; senão None.
+
+        O jogo está resolvido quando o stock está vazio e todas as cartas do
+        tableau estão viradas para cima: a carta mais baixa que falta está
+        sempre no topo de uma pilha e pode ir para a fundação.
+        """
+        if self.piles[STOCK]:
+            return None
+        for pile in TABLEAU:
+            if any(not self.face_up[card] for card in self.piles[pile]):
+                return None
+        game = self.copy()
+        moves = []
+        while not game.is_won():
+            for src in (WASTE,) + TABLEAU:
+                move = game.foundation_move(src)
+                if move is not None:
+                    game.move(*move)
+                    moves.append(move)
+                    break
+            else:
+                return None
+        return moves
+
+    def foundation_count(self):
+        return sum(len(self.piles[pile]) for pile in FOUNDATION)
+
+    def is_won(self):
+        return self.foundation_count() == DECK_SIZE
+
+    def copy(self):
+        other = Game.__new__(Game)
+        other.piles = [array("B", pile) for pile in self.piles]
+        other.face_up = bytearray(self.face_up)
+        other.location = bytearray(self.location)
+        other.position = bytearray(self.position)
+        other.waste_size = self.waste_size
+        other.passes_remaining = self.passes_remaining
+        other.journal = None
+        other.events = None
+        return other
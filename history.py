@@ -0,0 +1,44 @@
+from collections import deque
+
+
+class History:
+    """Histórico de jogadas guardado como deltas compactos.
+
+    Cada entrada é o conteúdo do diário do ``Game`` para uma ação do jogador
+    (4 bytes por operação). Só são mantidas as últimas ``limit`` ações.
+    """
+
+    __slots__ = ("actions",)
+
+    def __init__(self, limit=500):
+        self.actions = deque(maxlen=limit)
+
+    def __len__(self):
+        return len(self.actions)
+
+    def start(self, game):
+        """Começa a registar as alterações feitas ao jogo."""
+        game.journal = bytearray()
+
+    def record(self, game):
+        """Guarda as alterações registadas desde a última ação como um delta."""
+        if game.journal:
+            self.actions.append(bytes(game.journal))
+            game.journal.clear()
+
+    def discard(self, game):
+        """Esquece as alterações registadas que ainda não foram guardadas."""
+        if game.journal is not None:
+            game.journal.clear()
+
+    def undo(self, game):
+        """Desfaz a última ação; devolve as pilhas alteradas."""
+        self.discard(game)
+        return game.revert(self.actions.pop())
+
+    def load(self, deltas):
+        """Repõe deltas guardados fora do histórico, como os do diário de um jogo retomado."""
+        self.actions.extend(deltas)
+
+    def clear(self):
+        self.actions.clear()
@@ -0,0 +1,368 @@
+"""Diário das jogadas dos jogos em curso, para os retomar depois de uma falha.
+
+Cada jogo tem um checkpoint com o estado completo e um diário só de
+acréscimos com as operações feitas desde então:
+
+    <jogo>.ckpt          geração, segundos jogados e jogadas (3 x u32)
+                         + jogo salvo no formato do savefile
+    <jogo>.<geração>.log operações de 4 bytes
+
+As operações do diário são as do ``Game`` (mover, tirar, reciclar, virar),
+mais:
+
+    (OP_END, 0, tempo, tempo >> 8)   fim de uma ação, com o tempo restante
+    (OP_UNDO, n, n >> 8, 0)          seguida das n operações desfeitas
+
+Um único thread escreve os diários de todas as sessões: junta o que chega
+durante ``flush_interval`` e faz um só ``fsync`` por ficheiro (group commit).
+De ``checkpoint_every`` em ``checkpoint_every`` ações o estado é compactado
+num novo checkpoint, com a geração seguinte, e o diário antigo é apagado; se
+o processo parar a meio, o checkpoint antigo continua a ter o seu diário.
+
+Cada cliente guarda o identificador do seu jogo e só esse jogo é retomado.
+Os diários que ninguém abre há mais de ``max_age`` segundos são apagados
+pelo thread de escrita, no máximo uma vez por ``SWEEP_INTERVAL``; antes, o
+jogo recuperado é entregue a quem pediu a limpeza, para as estatísticas.
+"""
+import atexit
+import os
+import queue
+import re
+import struct
+import threading
+import time
+import uuid
+from collections import namedtuple
+
+import savefile
+from game import FOUNDATION, OP_DRAW, OP_FLIP, OP_MOVE, OP_RECYCLE, Game
+from movelog import FOUNDATION_POINTS, OP_END, OP_UNDO, check_op, delta_points
+
+CHECKPOINT = struct.Struct("<III")  # geração, segundos jogados, jogadas
+GAME_ID = re.compile(r"[0-9a-f]{32}")  # uuid4().hex; o identificador vem do cliente
+SWEEP_INTERVAL = 3600  # Segundos entre limpezas de cada pasta
+
+Recovered = namedtuple("Recovered", "game_id generation saved deltas seconds moves")
+
+_writer = None  # Um thread de escrita por processo
+_active = set()  # Jogos abertos neste processo, que não podem ser retomados por outra sessão
+_lock = threading.Lock()
+
+
+class JournalWriter:
+    """Escreve os diários em lotes num thread próprio."""
+
+    def __init__(self, flush_interval=0.05, batch_size=1000):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.pending = queue.Queue()
+        self.swept = {}  # Última limpeza de cada pasta
+        self.thread = threading.Thread(target=self.run, name="solitaire-journal", daemon=True)
+        self.thread.start()
+
+    def append(self, path, data):
+        self.pending.put(("append", path, data))
+
+    def checkpoint(self, path, data, old_log):
+        """Troca o checkpoint e apaga o diário que ele substitui."""
+        self.pending.put(("checkpoint", path, data, old_log))
+
+    def delete(self, paths):
+        self.pending.put(("delete", paths))
+
+    def sweep(self, directory, max_age, expired=None):
+        """Apaga os diários parados há mais de ``max_age`` segundos, se a pasta não foi limpa há pouco.
+
+        ``expired`` é chamada com o ``Recovered`` de cada jogo apagado.
+        """
+        now = time.monotonic()
+        if now - self.swept.get(directory, -SWEEP_INTERVAL) >= SWEEP_INTERVAL:
+            self.swept[directory] = now
+            self.pending.put(("sweep", directory, max_age, expired))
+
+    def flush(self):
+        """Espera até estar escrito tudo o que foi pedido até agora."""
+        done = threading.Event()
+        self.pending.put(("flush", done))
+        done.wait()
+
+    def run(self):
+        while True:
+            items = [self.pending.get()]
+            # Junta o que chegar até encher o lote, passar o intervalo ou alguém esperar pela escrita
+            deadline = time.monotonic() + self.flush_interval
+            while items[-1] is not None and items[-1][0] != "flush" and len(items) < self.batch_size:
+                try:
+                    items.append(self.pending.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            stop = items[-1] is None
+            self.write([item for item in items if item is not None])
+            if stop:
+                return
+
+    def write(self, items):
+        buffers = {}  # Acréscimos por ficheiro, escritos de uma vez
+        for item in items:
+            if item[0] == "append":
+                buffers.setdefault(item[1], bytearray()).extend(item[2])
+                continue
+            # As outras operações esperam pelos acréscimos feitos antes delas
+            self.write_buffers(buffers)
+            buffers = {}
+            try:
+                if item[0] == "checkpoint":
+                    _, path, data, old_log = item
+                    savefile.write_atomic(path, data)
+                    remove(old_log)
+                elif item[0] == "delete":
+                    for path in item[1]:
+                        remove(path)
+                elif item[0] == "sweep":
+                    sweep(*item[1:])
+            except OSError as error:
+                print(f"Erro ao escrever o diário: {error}")
+            if item[0] == "flush":
+                item[1].set()
+        self.write_buffers(buffers)
+
+    def write_buffers(self, buffers):
+        for path, data in buffers.items():
+            # Um erro num diário (disco cheio, pasta apagada) não pára os das outras sessões
+            try:
+                with open(path, "ab") as file:
+                    file.write(data)
+                    file.flush()
+                    os.fsync(file.fileno())
+            except OSError as error:
+                print(f"Erro ao escrever o diário: {error}")
+
+    def close(self):
+        """Escreve o que estiver pendente e termina o thread."""
+        if self.thread.is_alive():
+            self.pending.put(None)
+            self.thread.join()
+
+
+def remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def sweep(directory, max_age, expired=None):
+    """Apaga os jogos fechados cujos ficheiros não mudam há mais de ``max_age`` segundos.
+
+    Cada jogo é recuperado e entregue a ``expired`` antes de os seus
+    ficheiros serem apagados.
+    """
+    cutoff = time.time() - max_age
+    games = {}
+    try:
+        # Inclui os temporários (".save-...") de checkpoints interrompidos
+        for entry in os.scandir(directory):
+            games.setdefault(entry.name.split(".")[0], []).append(entry)
+    except FileNotFoundError:
+        return
+    for game_id, entries in games.items():
+        with _lock:
+            if game_id in _active:
+                continue
+            _active.add(game_id)  # Nenhuma sessão o retoma enquanto é apagado
+        try:
+            # O checkpoint pode ser antigo e o diário recente: conta o ficheiro mais novo
+            if max(entry.stat().st_mtime for entry in entries) >= cutoff:
+                continue
+            if expired is not None and GAME_ID.fullmatch(game_id):
+                recovered = recover(directory, game_id)
+                if recovered is not None:
+                    expired(recovered)
+            for entry in entries:
+                remove(entry.path)
+        except FileNotFoundError:
+            pass
+        finally:
+            with _lock:
+                _active.discard(game_id)
+
+
+def open_writer():
+    """Cria o thread de escrita uma única vez por processo."""
+    global _writer
+    with _lock:
+        if _writer is None:
+            _writer = JournalWriter()
+            atexit.register(_writer.close)
+    return _writer
+
+
+class GameJournal:
+    """O diário de um jogo, aberto por uma sessão."""
+
+    def __init__(self, directory, game_id=None, generation=0, checkpoint_every=200, max_age=7 * 86400, expired=None):
+        self.directory = directory
+        self.game_id = game_id or uuid.uuid4().hex
+        self.generation = generation
+        self.checkpoint_every = checkpoint_every
+        self.actions = 0  # Ações desde o último checkpoint
+        self.writer = open_writer()
+        os.makedirs(directory, exist_ok=True)
+        with _lock:
+            _active.add(self.game_id)
+        if max_age:
+            self.writer.sweep(directory, max_age, expired)
+
+    @property
+    def checkpoint_path(self):
+        return os.path.join(self.directory, f"{self.game_id}.ckpt")
+
+    def log_path(self):
+        return os.path.join(self.directory, f"{self.game_id}.{self.generation}.log")
+
+    def checkpoint(self, data, seconds=0, moves=0):
+        """Guarda o estado completo (``savefile.encode``), com o tempo e as jogadas, e começa um diário vazio."""
+        old_log = self.log_path()
+        self.generation += 1
+        self.actions = 0
+        header = CHECKPOINT.pack(self.generation, min(seconds, 0xFFFFFFFF), min(moves, 0xFFFFFFFF))
+        self.writer.checkpoint(self.checkpoint_path, header + data, old_log)
+
+    def record(self, ops, time_remaining):
+        """Acrescenta as operações de uma ação; devolve True se já é altura de um checkpoint."""
+        if not ops:
+            return False
+        self.writer.append(self.log_path(), bytes(ops) + end_op(time_remaining))
+        self.actions += 1
+        return self.actions >= self.checkpoint_every
+
+    def record_undo(self, delta, time_remaining):
+        """Regista as operações desfeitas, para a repetição não depender do histórico."""
+        count = len(delta) // 4
+        self.writer.append(self.log_path(), bytes((OP_UNDO, count & 0xFF, count >> 8, 0)) + delta + end_op(time_remaining))
+        self.actions += 1
+        return self.actions >= self.checkpoint_every
+
+    def close(self, delete=False):
+        """Larga o diário; com ``delete``, o jogo terminou e os ficheiros são apagados."""
+        with _lock:
+            if self.game_id not in _active:
+                return
+            _active.discard(self.game_id)
+        if delete:
+            self.writer.delete([self.checkpoint_path, self.log_path()])
+
+
+def end_op(time_remaining):
+    time_remaining = max(0, min(time_remaining, 0xFFFF))
+    return bytes((OP_END, 0, time_remaining & 0xFF, time_remaining >> 8))
+
+
+def replay(game, ops):
+    """Repete o diário sobre o jogo do checkpoint.
+
+    Só as ações completas e válidas são aplicadas; uma ação cortada a meio
+    (o processo parou durante a escrita) é desfeita. Devolve os deltas das
+    ações, para o histórico, os pontos ganhos, as cartas movidas e o último
+    tempo restante.
+    """
+    deltas = []
+    points = 0
+    action_points = 0
+    moves = 0
+    action_moves = 0
+    time_remaining = None
+    game.journal = bytearray()
+    i = 0
+    while i + 4 <= len(ops):
+        kind, a, b, c = ops[i:i + 4]
+        i += 4
+        if kind == OP_END:
+            if game.journal:
+                deltas.append(bytes(game.journal))
+                game.journal.clear()
+            points += action_points
+            moves += action_moves
+            action_points = 0
+            action_moves = 0
+            time_remaining = b | c << 8
+        elif kind == OP_UNDO:
+            # As operações desfeitas vêm no diário: a ação pode ser anterior ao checkpoint
+            delta = bytes(ops[i:i + 4 * (a | b << 8)])
+            i += len(delta)
+            if game.journal or len(delta) != 4 * (a | b << 8):
+                break
+            game.revert(delta)
+            points -= delta_points(delta)
+            if deltas and deltas[-1] == delta:
+                deltas.pop()
+        elif not check_op(game, kind, a, b, c):
+            break
+        elif kind == OP_MOVE:
+            game.move(a, b, c)
+            action_moves += 1
+            if b in FOUNDATION:
+                action_points += FOUNDATION_POINTS
+        elif kind == OP_DRAW:
+            game.draw()
+        elif kind == OP_RECYCLE:
+            game.recycle()
+        elif kind == OP_FLIP:
+            game.set_face(a, True)
+        else:
+            break
+    if game.journal:
+        game.revert(bytes(game.journal))
+    game.journal = None
+    return deltas, points, moves, time_remaining
+
+
+def recover(directory, game_id):
+    """Lê o checkpoint e repete o diário; devolve um ``Recovered``, ou None se não houver checkpoint válido."""
+    try:
+        data = savefile.read_file(os.path.join(directory, f"{game_id}.ckpt"))
+    except FileNotFoundError:
+        return None
+    try:
+        generation, seconds, moves = CHECKPOINT.unpack_from(data)
+        saved = savefile.decode(data[CHECKPOINT.size:])
+    except (ValueError, struct.error):
+        return None  # Cortado, ou de uma versão anterior
+    try:
+        ops = savefile.read_file(os.path.join(directory, f"{game_id}.{generation}.log"))
+    except FileNotFoundError:
+        ops = b""
+    game = Game(saved.waste_size, saved.passes_remaining)
+    game.load(saved.piles, saved.face_up)
+    deltas, points, log_moves, time_remaining = replay(game, ops)
+    if time_remaining is not None:
+        # Depois do checkpoint, o tempo de jogo é o que o relógio do jogo contou
+        seconds += max(0, saved.time_remaining - time_remaining)
+    saved = saved._replace(
+        piles=[list(pile) for pile in game.piles],
+        face_up=bytearray(game.face_up),
+        passes_remaining=game.passes_remaining,
+        score=saved.score + points,
+        time_remaining=saved.time_remaining if time_remaining is None else time_remaining,
+    )
+    return Recovered(game_id, generation, saved, deltas, seconds, moves + log_moves)
+
+
+def resume(directory, game_id):
+    """Reserva e recupera o jogo ``game_id``, se existir e nenhuma sessão o tiver aberto.
+
+    Devolve um ``Recovered``, ou None; o jogo devolvido fica reservado para
+    o ``GameJournal`` que o vai continuar.
+    """
+    if not isinstance(game_id, str) or not GAME_ID.fullmatch(game_id):
+        return None
+    with _lock:
+        if game_id in _active:
+            return None
+        _active.add(game_id)
+    open_writer().flush()  # O diário da sessão que acabou de fechar fica completo
+    recovered = recover(directory, game_id)
+    if recovered is None:
+        with _lock:
+            _active.discard(game_id)
+    return recovered
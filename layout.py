@@ -1,11 +1,62 @@
+import datetime
 import flet as ft
 from settings import SettingsDialog
+from stats import open_stats
+
+def create_rules_dialog():
+    rules_md = ft.Markdown(
+        """
+        Klondike is played with a standard 52-card deck, without Jokers.
+        ... (resto das regras)
+        """
+    )
+
+    return ft.AlertDialog(
+        title=ft.Text("Solitaire rules"),
+        content=rules_md,
+        on_dismiss=lambda e: print("Dialog dismissed!")
+    )
+
+
+def create_leaderboard_dialog(solitaire):
+    """Melhores resultados deste jogo e totais por modo de tiragem."""
+    settings = solitaire.settings
+    store = open_stats(settings.stats_db)
+    draw = solitaire.game.waste_size
+    rows = [
+        ft.Text(
+            f"{position}. {result.score} pontos em {result.seconds // 60:02}:{result.seconds % 60:02}"
+            f" ({datetime.date.fromtimestamp(result.played_at).isoformat()})"
+        )
+        for position, result in enumerate(store.leaderboard(solitaire.seed, draw), 1)
+    ] or [ft.Text("Ainda ninguém ganhou este jogo.")]
+    for totals in store.totals():
+        win_rate = totals.wins / totals.played if totals.played else 0
+        best_time = f"{totals.best_time // 60:02}:{totals.best_time % 60:02}" if totals.best_time is not None else "-"
+        rows.append(ft.Text(
+            f"Tirar {totals.draw}: {totals.played} jogos, {win_rate:.0%} ganhos,"
+            f" melhor pontuação {totals.best_score}, melhor tempo {best_time}",
+            weight=ft.FontWeight.BOLD,
+        ))
+    return ft.AlertDialog(
+        title=ft.Text(f"Classificação do jogo {solitaire.seed}"),
+        content=ft.Column(rows, tight=True, scroll=ft.ScrollMode.AUTO),
+    )
+
 
 def create_appbar(page, settings, on_new_game):
+    rules_dialog = None  # Só é criado quando as regras são abertas pela primeira vez
+
     def new_game_clicked(e):
         on_new_game(settings)
 
+    def daily_game_clicked(e):
+        on_new_game(settings, daily=True)
+
     def show_rules(e):
+        nonlocal rules_dialog
+        if rules_dialog is None:
+            rules_dialog = create_rules_dialog()
         page.dialog = rules_dialog
         rules_dialog.open = True
         page.update()
@@ -18,19 +69,31 @@ def create_appbar(page, settings, on_new_game):
     def undo_move(e):
         if hasattr(page, 'solitaire'):
             page.solitaire.undo()
-            page.update()
+
+    def show_hint(e):
+        if hasattr(page, 'solitaire'):
+            page.solitaire.show_hint()
 
     def save_game(e):
         if hasattr(page, 'solitaire'):
-            page.solitaire.save_game()
+            page.solitaire.save_game(save_slot_dropdown.value)
             print("Jogo salvo com sucesso!")
 
     def load_game(e):
         if hasattr(page, 'solitaire'):
-            page.solitaire.load_game()
-            page.update()
+            page.solitaire.load_game(save_slot_dropdown.value)
             print("Jogo carregado com sucesso!")
 
+    def show_leaderboard(e):
+        if hasattr(page, 'solitaire') and settings.stats_db:
+            page.dialog = create_leaderboard_dialog(page.solitaire)
+            page.dialog.open = True
+            page.update()
+
+    def toggle_metrics(e):
+        if hasattr(page, 'solitaire'):
+            page.solitaire.toggle_metrics()
+
     def change_card_back(e):
         """Altera o design das costas das cartas."""
         selected_back = card_back_dropdown.value
@@ -59,10 +122,23 @@ def create_appbar(page, settings, on_new_game):
         value="0",  # Valor padrão
     )
 
+    # Dropdown para escolher o slot usado pelos botões Save e Load
+    save_slot_dropdown = ft.Dropdown(
+        width=100,
+        options=[
+            ft.dropdown.Option("default", "Slot 1"),
+            ft.dropdown.Option("slot2", "Slot 2"),
+            ft.dropdown.Option("slot3", "Slot 3"),
+        ],
+        value="default",
+    )
+
     score_text = ft.Text("Pontuação: 0", size=20, color=ft.colors.WHITE)
 
     timer_text = ft.Text("Tempo: 00:00", size=20, color=ft.colors.WHITE)
 
+    odds_text = ft.Text("Hipóteses: -", size=20, color=ft.colors.WHITE, visible=False)
+
     page.appbar = ft.AppBar(
         leading=ft.Image(src=f"/images/card.png"),  # Ícone do jogo
         leading_width=40,  # Largura do ícone
@@ -71,14 +147,20 @@ def create_appbar(page, settings, on_new_game):
         actions=[
             ft.TextButton("New game", on_click=new_game_clicked),
             ft.TextButton("Undo", on_click=undo_move),
+            ft.TextButton("Hint", on_click=show_hint),
             ft.TextButton("Save", on_click=save_game),
             ft.TextButton("Load", on_click=load_game),
             ft.TextButton("Play", on_click=start_timer),  # Botão para iniciar o temporizador
             timer_text,  # Exibe o tempo restante
             score_text,
+            odds_text,  # Probabilidade estimada de ganhar, se ligada nas configurações
             card_back_dropdown,  # Dropdown para escolher o design das costas das cartas
+            save_slot_dropdown,  # Dropdown para escolher o slot do jogo salvo
+            ft.TextButton("Leaderboard", on_click=show_leaderboard),
+            ft.TextButton("Daily", tooltip="Jogo do dia", on_click=daily_game_clicked),
             ft.TextButton("Rules", on_click=show_rules),
             ft.IconButton(ft.icons.SETTINGS, on_click=show_settings),
+            ft.IconButton(ft.icons.SPEED, tooltip="Desempenho", on_click=toggle_metrics),
         ],
     )
 
@@ -86,16 +168,3 @@ def create_appbar(page, settings, on_new_game):
     if hasattr(page, 'solitaire'):
         page.solitaire.timer_text = timer_text
         page.solitaire.score_text = score_text
-
-    rules_md = ft.Markdown(
-        """
-        Klondike is played with a standard 52-card deck, without Jokers.
-        ... (resto das regras)
-        """
-    )
-
-    rules_dialog = ft.AlertDialog(
-        title=ft.Text("Solitaire rules"),
-        content=rules_md,
-        on_dismiss=lambda e: print("Dialog dismissed!")
-    )
\ No newline at end of file
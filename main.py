@@ -1,12 +1,53 @@
 import logging
+import time
+import uuid
 import flet as ft
+import savefile
 from layout import create_appbar
 from settings import Settings
 from solitaire import Solitaire
 
 # logging.basicConfig(level=logging.DEBUG)
 
-def main(page: ft.Page):
+JOURNAL_KEY = "solitaire.journal"  # Jogo por terminar deste browser, guardado no cliente
+CLIENT_KEY = "solitaire.client"  # Identificador deste browser, dono dos seus jogos salvos
+
+
+def stored_journal_id(page):
+    """Identificador do jogo que este cliente deixou por terminar, se houver."""
+    try:
+        return page.client_storage.get(JOURNAL_KEY)
+    except (TimeoutError, ValueError):  # Sem resposta, ou um valor que não é JSON
+        return None
+
+
+def remember_journal(page, solitaire):
+    """Guarda no cliente o identificador do diário do jogo, para o retomar ao voltar."""
+    if solitaire.journal_id is not None:
+        try:
+            page.client_storage.set(JOURNAL_KEY, solitaire.journal_id)
+        except TimeoutError:
+            pass
+
+
+def stored_client_id(page):
+    """Identificador deste cliente para os jogos salvos; criado e guardado no cliente na primeira visita."""
+    try:
+        client_id = page.client_storage.get(CLIENT_KEY)
+    except (TimeoutError, ValueError):  # Sem resposta, ou um valor que não é JSON
+        return None
+    if isinstance(client_id, str) and savefile.CLIENT_ID.fullmatch(client_id):
+        return client_id
+    client_id = uuid.uuid4().hex
+    try:
+        page.client_storage.set(CLIENT_KEY, client_id)
+    except TimeoutError:
+        return None
+    return client_id
+
+
+def main(page: ft.Page, settings=None):
+    started = time.perf_counter()  # Para medir o tempo até o jogo poder ser jogado
     page.title = "Flet Solitaire"  # Título da janela
     page.window_width = 1000  # Largura da janela
     page.window_height = 700  # Altura da janela
@@ -14,15 +55,20 @@ def main(page: ft.Page):
     page.favicon = "assets/favicon.ico"  # Define o favicon
 
     # Função para iniciar um novo jogo
-    def on_new_game(settings):
+    def on_new_game(settings, daily=False):
         if hasattr(page, 'solitaire'):
+            page.solitaire.stop_timer()  # O relógio do jogo antigo deixa de contar
+            page.solitaire.end_journal()  # Nem o seu diário é preciso
             page.controls.pop()  # Remove o jogo atual
-        new_solitaire = Solitaire(settings, on_win)
+        new_solitaire = Solitaire(settings, on_win, daily=daily, client_id=page.client_id)
         page.solitaire = new_solitaire  # Armazena o objeto solitaire na página
         page.add(new_solitaire)
+        remember_journal(page, new_solitaire)
         
         # Referência ao texto do temporizador na barra de aplicativos
-        page.solitaire.timer_text = page.appbar.actions[4]  # Ajuste o índice conforme necessário
+        page.solitaire.timer_text = page.appbar.actions[6]  # Ajuste o índice conforme necessário
+        page.solitaire.odds_text = page.appbar.actions[8]
+        page.solitaire.refresh_odds()
         
         # Inicia o temporizador
         page.solitaire.start_timer()
@@ -34,26 +80,35 @@ def main(page: ft.Page):
         page.add(ft.AlertDialog(title=ft.Text("YOU WIN!"), open=True, on_dismiss=lambda e: page.controls.pop()))
         page.update()
 
-    # Adiciona uma animação de carregamento
-    loading_animation = ft.Image(src="assets/loading.gif", width=1000, height=700)
-    page.add(loading_animation)
-
-    # Simula um tempo de carregamento
-    import time
-    time.sleep(3)  # Remove isso no ambiente de produção
-
-    # Remove a animação e adiciona o jogo
-    page.controls.clear()
+    # Sem ecrã de carregamento: o tabuleiro vai logo na primeira atualização,
+    # e os diálogos de regras e de configurações só são criados quando abertos
 
     # Configurações iniciais
-    settings = Settings()
+    settings = settings or Settings()
 
     # Cria a barra de aplicativos
     create_appbar(page, settings, on_new_game)
 
-    # Inicia o jogo
-    solitaire = Solitaire(settings, on_win)
+    # Inicia o jogo, ou retoma o que este cliente deixou por terminar
+    journal_id = stored_journal_id(page) if settings.journal_dir else None
+    solitaire = Solitaire(settings, on_win, journal_id=journal_id)
     page.solitaire = solitaire  # Armazena o objeto solitaire na página
     page.add(solitaire)
+    if solitaire.journal_id != journal_id:
+        remember_journal(page, solitaire)
+    solitaire.odds_text = page.appbar.actions[8]
+    solitaire.refresh_odds()
+
+    # Tempo até o tabuleiro estar no cliente e o jogo poder ser jogado
+    first_interactive = time.perf_counter() - started
+    if solitaire.metrics is not None:
+        solitaire.metrics.add("first_interactive", first_interactive)
+    logging.info("Jogo pronto em %.0f ms", first_interactive * 1000)
+
+    # Só o Save e o Load precisam do identificador do cliente: é lido com o jogo já pronto
+    page.client_id = stored_client_id(page) or solitaire.client_id
+    solitaire.client_id = page.client_id
+    return first_interactive
 
-ft.app(target=main, view=ft.WEB_BROWSER, assets_dir="assets")
\ No newline at end of file
+if __name__ == "__main__":
+    ft.app(target=main, view=ft.WEB_BROWSER, assets_dir="assets")
\ No newline at end of file
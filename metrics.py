@@ -0,0 +1,95 @@
+"""Instrumentação opcional dos caminhos críticos de uma sessão.
+
+Os métodos marcados com ``@timed`` só medem quando a sessão tem um
+``Metrics``; sem ele, o custo é uma verificação de atributo por chamada.
+"""
+import functools
+import json
+import threading
+import time
+
+import flet as ft
+
+
+class Metrics:
+    """Contagem, tempo total e tempo máximo de cada operação medida."""
+
+    __slots__ = ("stats", "started", "lock")
+
+    def __init__(self):
+        self.stats = {}  # nome -> [contagem, segundos, máximo]
+        self.started = time.time()
+        self.lock = threading.Lock()  # O relógio mede a partir de outro thread
+
+    def add(self, name, seconds):
+        with self.lock:
+            stat = self.stats.get(name)
+            if stat is None:
+                self.stats[name] = [1, seconds, seconds]
+            else:
+                stat[0] += 1
+                stat[1] += seconds
+                if seconds > stat[2]:
+                    stat[2] = seconds
+
+    def snapshot(self):
+        """Métricas em milissegundos, prontas para JSON."""
+        with self.lock:
+            stats = {name: list(stat) for name, stat in self.stats.items()}
+        return {
+            name: {
+                "count": count,
+                "total_ms": round(total * 1000, 3),
+                "mean_ms": round(total * 1000 / count, 3),
+                "max_ms": round(peak * 1000, 3),
+            }
+            for name, (count, total, peak) in sorted(stats.items())
+        }
+
+    def to_json(self, session=None):
+        return json.dumps({
+            "session": session,
+            "started": self.started,
+            "time": time.time(),
+            "metrics": self.snapshot(),
+        }).encode()
+
+
+def timed(name):
+    """Mede o método quando a sessão tem a instrumentação ligada."""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            # Cartas e slots usam as métricas do jogo a que pertencem
+            metrics = getattr(self, "solitaire", self).metrics
+            if metrics is None:
+                return method(self, *args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                metrics.add(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+class MetricsOverlay(ft.Container):
+    """Painel por cima do jogo com as métricas da sessão."""
+
+    def __init__(self):
+        super().__init__()
+        self.text = ft.Text(size=12, color=ft.colors.WHITE, font_family="monospace")
+        self.content = self.text
+        self.bgcolor = ft.colors.with_opacity(0.7, ft.colors.BLACK)
+        self.padding = 8
+        self.border_radius = ft.border_radius.all(6)
+        self.right = 10
+        self.bottom = 10
+
+    def show(self, metrics):
+        lines = [
+            f"{name:<13}{stat['count']:>7}{stat['mean_ms']:>9.2f} ms{stat['max_ms']:>9.2f} ms"
+            for name, stat in metrics.snapshot().items()
+        ]
+        self.text.value = "\n".join(lines) or "Sem medições ainda."
+        self.update()
@@ -0,0 +1,212 @@
+"""Gerador de jogadas legais em lote, sobre posições codificadas em arrays.
+
+Cada posição é codificada em arrays de tamanho fixo: as cartas de cada
+pilha (``board``, -1 nas casas vazias), o tamanho das pilhas, as cartas
+viradas para cima como máscara de bits (bit ``c`` para a carta ``c``), o
+número de cartas tiradas de cada vez e as passagens restantes. As regras
+são aplicadas a todas as posições de uma vez com o NumPy, sem ciclos em
+Python por posição.
+
+As jogadas são as mesmas de ``Game.legal_moves``. Para verificar a
+equivalência com as regras do jogo em posições aleatórias:
+
+    python movegen.py --positions 20000
+"""
+import argparse
+import random
+import sys
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from game import (
+    DECK_SIZE, FOUNDATION, PILE_COUNT, STOCK, TABLEAU, WASTE, Game, can_place_on_foundation, can_place_on_tableau,
+    shuffled_deck,
+)
+
+MAX_PILE = 24  # O stock começa com 24 cartas; nenhuma pilha pode ter mais
+
+Positions = namedtuple("Positions", "board lengths face_up draw passes")
+
+IS_TABLEAU = np.zeros(PILE_COUNT, bool)
+IS_TABLEAU[list(TABLEAU)] = True
+IS_FOUNDATION = np.zeros(PILE_COUNT, bool)
+IS_FOUNDATION[list(FOUNDATION)] = True
+PILES = np.arange(PILE_COUNT)
+
+
+def encode(games):
+    """Codifica uma lista de ``Game`` em arrays com uma linha por posição."""
+    count = len(games)
+    board = np.full((count, PILE_COUNT, MAX_PILE), -1, np.int8)
+    lengths = np.zeros((count, PILE_COUNT), np.int8)
+    face_up = np.zeros(count, np.uint64)
+    for index, game in enumerate(games):
+        for pile, cards in enumerate(game.piles):
+            board[index, pile, :len(cards)] = cards
+            lengths[index, pile] = len(cards)
+        face_up[index] = sum(1 << card for card in range(DECK_SIZE) if game.face_up[card])
+    draw = np.array([game.waste_size for game in games], np.int8)
+    passes = np.array([game.passes_remaining for game in games], np.int32)
+    return Positions(board, lengths, face_up, draw, passes)
+
+
+def is_face_up(face_up, cards):
+    """Lê o bit de cada carta na máscara da sua posição (``cards`` >= 0)."""
+    shift = np.maximum(cards, 0).astype(np.uint64)
+    return ((face_up >> shift) & np.uint64(1)).astype(bool)
+
+
+def tableau_rule(cards, tops):
+    """``can_place_on_tableau`` para arrays; ``tops`` < 0 é uma coluna vazia."""
+    cards = cards.astype(np.int16)
+    tops = tops.astype(np.int16)
+    on_empty = (tops < 0) & (cards % 13 == 12)
+    stacked = (tops >= 0) & ((cards < 26) != (tops < 26)) & (tops % 13 - cards % 13 == 1)
+    return on_empty | stacked
+
+
+def foundation_rule(cards, tops):
+    """``can_place_on_foundation`` para arrays; ``tops`` < 0 é uma fundação vazia."""
+    cards = cards.astype(np.int16)
+    tops = tops.astype(np.int16)
+    on_empty = (tops < 0) & (cards % 13 == 0)
+    stacked = (tops >= 0) & (cards - tops == 1) & (cards // 13 == tops // 13)
+    return on_empty | stacked
+
+
+def legal_moves(positions):
+    """Todas as jogadas legais de todas as posições.
+
+    Devolve um array ``(M, 4)`` com linhas ``(posição, origem, destino,
+    quantidade)``, ordenado pela posição.
+    """
+    board, lengths, face_up, draw, passes = positions
+    count = len(lengths)
+    lengths = lengths.astype(np.int16)
+    slots = np.arange(MAX_PILE)
+    present = slots < lengths[:, :, None]
+    cards = np.where(present, board, -1).astype(np.int16)
+    up = present & is_face_up(face_up[:, None, None], cards)
+
+    top_index = np.maximum(lengths - 1, 0)
+    tops = np.where(lengths > 0, np.take_along_axis(cards, top_index[:, :, None], axis=2)[:, :, 0], -1)
+    top_up = (lengths > 0) & is_face_up(face_up[:, None], tops)
+
+    # Virar a carta do topo de uma coluna
+    reveal = np.nonzero((lengths > 0) & ~top_up & IS_TABLEAU)
+    reveals = np.column_stack((reveal[0], reveal[1], reveal[1], np.zeros(len(reveal[0]), np.int64)))
+
+    # Cartas que podem ser movidas: as viradas para cima do tableau e o topo do waste e das fundações
+    is_top = slots == top_index[:, :, None]
+    source = IS_TABLEAU[:, None] | ((PILES == WASTE) | IS_FOUNDATION)[:, None] & is_top
+    movable = up & source & (PILES != STOCK)[:, None]
+    amount = lengths[:, :, None] - slots  # Cartas que saem com a carta de cada casa
+
+    moving = cards[:, :, :, None]
+    targets = tops[:, None, None, :]
+    allowed = (
+        IS_TABLEAU & tableau_rule(moving, targets)
+        | IS_FOUNDATION & (amount[:, :, :, None] == 1) & foundation_rule(moving, targets)
+    )
+    allowed &= movable[:, :, :, None] & (PILES[:, None, None] != PILES)
+    index, src, slot, dst = np.nonzero(allowed)
+    card_moves = np.column_stack((index, src, dst, lengths[index, src] - slot))
+
+    # Tirar do baralho ou recicla-lo
+    stock_size = lengths[:, STOCK]
+    waste_size = lengths[:, WASTE]
+    drawing = np.nonzero(stock_size > 0)[0]
+    draws = np.column_stack((
+        drawing, np.full(len(drawing), STOCK), np.full(len(drawing), WASTE),
+        np.minimum(draw[drawing], stock_size[drawing]),
+    ))
+    recycling = np.nonzero((stock_size == 0) & (waste_size > 0) & (passes > 1))[0]
+    recycles = np.column_stack((
+        recycling, np.full(len(recycling), WASTE), np.full(len(recycling), STOCK), waste_size[recycling],
+    ))
+
+    moves = np.concatenate((reveals, card_moves, draws, recycles)).astype(np.int32)
+    return moves[np.argsort(moves[:, 0], kind="stable")] if count else moves
+
+
+def moves_by_position(positions):
+    """As jogadas de ``legal_moves`` agrupadas numa lista por posição."""
+    result = [[] for _ in range(len(positions.lengths))]
+    for index, src, dst, count in legal_moves(positions).tolist():
+        result[index].append((src, dst, count))
+    return result
+
+
+def random_positions(count, seed=0):
+    """Posições variadas: jogos distribuídos e jogados ao acaso durante algumas jogadas."""
+    rng = random.Random(seed)
+    games = []
+    for _ in range(count):
+        game = Game(rng.choice((1, 3)), rng.choice((1, 2, 3, 1000)))
+        game.deal(shuffled_deck(rng.randrange(2**32)))
+        for _ in range(rng.randrange(200)):
+            moves = game.legal_moves()
+            if not moves:
+                break
+            game.apply(rng.choice(moves))
+        games.append(game)
+    return games
+
+
+def check_rules():
+    """Compara as regras vetorizadas com as do jogo para todos os pares (carta, topo)."""
+    cards = np.repeat(np.arange(DECK_SIZE), DECK_SIZE + 1)
+    tops = np.tile(np.arange(-1, DECK_SIZE), DECK_SIZE)
+    tableau = tableau_rule(cards, tops)
+    foundation = foundation_rule(cards, tops)
+    for card, top, on_tableau, on_foundation in zip(cards.tolist(), tops.tolist(), tableau, foundation):
+        top = None if top < 0 else top
+        if on_tableau != can_place_on_tableau(card, top) or on_foundation != can_place_on_foundation(card, top):
+            return False
+    return True
+
+
+def check_positions(games):
+    """Compara as jogadas geradas com ``Game.legal_moves`` e ``Game.can_move``; devolve as diferenças."""
+    differences = []
+    for index, (game, moves) in enumerate(zip(games, moves_by_position(encode(games)))):
+        expected = sorted(game.legal_moves())
+        if sorted(moves) != expected:
+            differences.append((index, expected, sorted(moves)))
+            continue
+        for src, dst, count in moves:
+            if src != dst and STOCK not in (src, dst) and not game.can_move(src, dst, count):
+                differences.append((index, expected, sorted(moves)))
+                break
+    return differences
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Verifica o gerador de jogadas em lote contra as regras do jogo.")
+    parser.add_argument("--positions", type=int, default=10000, help="posições aleatórias a comparar")
+    parser.add_argument("--seed", type=int, default=0, help="seed das posições")
+    args = parser.parse_args(argv)
+
+    if not check_rules():
+        print("As regras vetorizadas diferem de can_place_on_tableau/can_place_on_foundation")
+        return 1
+    games = random_positions(args.positions, args.seed)
+    differences = check_positions(games)
+    for index, expected, generated in differences[:10]:
+        print(f"posição {index}: esperado {expected}, gerado {generated}")
+
+    positions = encode(games)
+    start = time.perf_counter()
+    legal_moves(positions)
+    elapsed = time.perf_counter() - start
+    print(
+        f"{len(games)} posições, {len(differences)} diferenças, {len(games) / elapsed:.0f} posições/s",
+        file=sys.stderr,
+    )
+    return 1 if differences else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,184 @@
+"""Registo das jogadas de cada partida e motor de repetição sem interface.
+
+O registo guarda a seed do jogo e, por ordem, as operações do diário do
+``Game`` feitas pelo jogador (mover cartas, tirar do baralho, reciclar o
+baralho, virar cartas), separadas por ação, e os "desfazer".
+
+Formato (little-endian):
+
+    b"KML", versão (u8), waste_size (u8), passagens permitidas (u16),
+    seed (u32), pontuação (i32),
+    operações de 4 bytes: as do diário, mais OP_END (fim de ação) e OP_UNDO
+
+Para verificar registos em lote:
+
+    python movelog.py saves/logs/*.kml
+"""
+import argparse
+import multiprocessing
+import struct
+import sys
+import time
+from collections import namedtuple
+
+from game import (
+    FOUNDATION, OP_DRAW, OP_FLIP, OP_MOVE, OP_RECYCLE, STOCK, TABLEAU, WASTE, Game, shuffled_deck,
+)
+from history import History
+
+MAGIC = b"KML"
+VERSION = 1
+HEADER = struct.Struct("<3sBBHIi")
+
+# Operações que só existem no registo
+OP_END = 4  # (OP_END, 0, 0, 0): fim de uma ação do jogador
+OP_UNDO = 5  # (OP_UNDO, 0, 0, 0): o jogador desfez a última ação
+
+FOUNDATION_POINTS = 10  # Pontos por carta levada para a fundação, como em ``Card.place``
+
+def delta_points(ops):
+    """Pontos ganhos pelas operações de um delta; desfazê-lo tira-os outra vez."""
+    return sum(FOUNDATION_POINTS for i in range(0, len(ops), 4) if ops[i] == OP_MOVE and ops[i + 2] in FOUNDATION)
+
+
+MoveLog = namedtuple("MoveLog", "waste_size passes seed score ops")
+ReplayResult = namedtuple("ReplayResult", "valid error actions score won")
+
+
+class MoveRecorder:
+    """Acumula as jogadas de uma partida à medida que são guardadas no histórico.
+
+    Um registo sem seed (por exemplo, depois de carregar um jogo salvo) não
+    pode ser repetido a partir da distribuição inicial.
+    """
+
+    __slots__ = ("waste_size", "passes", "seed", "ops")
+
+    def __init__(self, waste_size, passes, seed):
+        self.waste_size = waste_size
+        self.passes = passes
+        self.seed = seed
+        self.ops = bytearray()
+
+    def record(self, journal):
+        """Acrescenta as operações de uma ação (o diário ainda por guardar)."""
+        if journal:
+            self.ops += journal
+            self.ops += bytes((OP_END, 0, 0, 0))
+
+    def record_undo(self):
+        self.ops += bytes((OP_UNDO, 0, 0, 0))
+
+    def export(self, score=0):
+        if self.seed is None:
+            raise ValueError("Registo sem seed: o jogo não começou numa distribuição conhecida")
+        header = HEADER.pack(MAGIC, VERSION, self.waste_size, min(self.passes, 0xFFFF), self.seed, score)
+        return header + bytes(self.ops)
+
+
+def decode(data):
+    magic, version, waste_size, passes, seed, score = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Registo de jogadas inválido")
+    ops = bytes(data[HEADER.size:])
+    if len(ops) % 4:
+        raise ValueError("Registo de jogadas truncado")
+    return MoveLog(waste_size, passes, seed, score, ops)
+
+
+def check_op(game, kind, a, b, c):
+    """Indica se a operação é uma jogada legal na posição atual."""
+    piles = game.piles
+    if kind == OP_MOVE:
+        # As mesmas regras de check_tableau_rules e check_foundation_rules
+        return game.can_move(a, b, c)
+    if kind == OP_DRAW:
+        return a > 0 and a == min(game.waste_size, len(piles[STOCK]))
+    if kind == OP_RECYCLE:
+        return not piles[STOCK] and game.can_recycle() and a == len(piles[WASTE])
+    if kind == OP_FLIP:
+        pile = game.location[a]
+        return b == 1 and pile in TABLEAU and game.top(pile) == a and not game.face_up[a]
+    return False
+
+
+def replay(log):
+    """Repete o registo a partir da distribuição, verificando cada jogada.
+
+    Devolve um ``ReplayResult``; ``error`` diz em que operação (índice em
+    ``log.ops``, em bytes) o registo deixou de ser válido.
+    """
+    game = Game(log.waste_size, log.passes)
+    game.deal(shuffled_deck(log.seed))
+    history = History(None)
+    history.start(game)
+    ops = log.ops
+    actions = 0
+    score = 0
+    for i in range(0, len(ops), 4):
+        kind, a, b, c = ops[i:i + 4]
+        if kind == OP_END:
+            if not game.journal:
+                return ReplayResult(False, i, actions, score, False)
+            history.record(game)
+            actions += 1
+        elif kind == OP_UNDO:
+            if game.journal or not len(history):
+                return ReplayResult(False, i, actions, score, False)
+            score -= delta_points(history.actions[-1])
+            history.undo(game)
+            actions += 1
+        elif not check_op(game, kind, a, b, c):
+            return ReplayResult(False, i, actions, score, False)
+        elif kind == OP_MOVE:
+            game.move(a, b, c)
+            if b in FOUNDATION:
+                score += FOUNDATION_POINTS
+        elif kind == OP_DRAW:
+            game.draw()
+        elif kind == OP_RECYCLE:
+            game.recycle()
+        else:
+            game.set_face(a, True)
+    if game.journal:
+        # Operações depois do último fim de ação
+        return ReplayResult(False, len(ops), actions, score, False)
+    return ReplayResult(True, None, actions, score, game.is_won())
+
+
+def verify_file(path):
+    """Repete um ficheiro de registo; corre nos processos do pool."""
+    with open(path, "rb") as file:
+        log = decode(file.read())
+    result = replay(log)
+    return path, log, result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Repete e verifica registos de jogadas.")
+    parser.add_argument("inputs", nargs="+", help="ficheiros .kml")
+    parser.add_argument("--workers", type=int, default=None, help="processos (por omissão, um por CPU)")
+    parser.add_argument("--chunksize", type=int, default=64, help="registos enviados a cada processo de uma vez")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    invalid = 0
+    with multiprocessing.Pool(args.workers) as pool:
+        for path, log, result in pool.imap_unordered(verify_file, args.inputs, args.chunksize):
+            if not result.valid:
+                invalid += 1
+                print(f"{path}: jogada ilegal na operação {result.error // 4}")
+            elif log.score != result.score and not (result.won and log.score > result.score):
+                # Ao vencer, a pontuação pode incluir o bónus de tempo
+                invalid += 1
+                print(f"{path}: pontuação {log.score}, mas as jogadas valem {result.score}")
+    elapsed = time.perf_counter() - start
+    print(
+        f"{len(args.inputs)} registos, {invalid} com problemas, {len(args.inputs) / elapsed:.1f} registos/s",
+        file=sys.stderr,
+    )
+    return 1 if invalid else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
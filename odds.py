@@ -0,0 +1,308 @@
+"""Estimativa da probabilidade de ganhar a partir da posição atual (Monte Carlo).
+
+As cartas viradas para baixo (no tableau e no stock) são tratadas como
+desconhecidas: cada amostra distribui-as ao acaso pelos seus lugares e
+decide se essa distribuição ainda se ganha. Primeiro todas as amostras de um
+lote são jogadas juntas, em arrays do NumPy, com uma política gulosa simples,
+uma jogada por passo:
+
+1. do waste para a fundação;
+2. do tableau para a fundação;
+3. a sequência virada para cima de uma coluna, se destapar uma carta;
+4. do waste para o tableau;
+5. tirar do baralho, ou reciclá-lo.
+
+A política sozinha ganha poucas distribuições, mesmo as que têm solução, e
+por isso não distingue uma posição ganha de uma perdida. Algumas das amostras
+que ela não ganha, no máximo ``SOLVER_SAMPLES`` por estimativa, são
+decididas pelo solver num pool de processos, fora do processo do servidor; a
+proporção das que têm solução vale para todas as perdidas. As que o solver
+não decide a tempo contam como meia vitória. O NumPy é opcional: sem ele,
+``available()`` é falso e o jogo não mostra as hipóteses.
+"""
+import multiprocessing
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from game import STOCK, TABLEAU, WASTE, Game
+from solver import SOLVED, UNWINNABLE, solve
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+MAX_COLUMN = 20  # 6 cartas escondidas e 13 viradas, com folga
+MAX_TALON = 24
+SOLVER_SAMPLES = 16  # Amostras perdidas pela política que o solver decide em cada estimativa
+UNDECIDED = 0.5  # Valor de uma amostra que o solver não decide: tanto pode ter solução como não
+
+OddsEstimate = namedtuple("OddsEstimate", "probability samples")
+
+# Um único thread calcula as estimativas de todas as sessões
+_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="solitaire-odds")
+_solvers = None  # Processos do solver, criados na primeira estimativa
+
+
+def available():
+    return np is not None
+
+
+def submit(function):
+    return _pool.submit(function)
+
+
+def solver_pool():
+    """O pool de processos do solver; deixa um CPU para o servidor."""
+    global _solvers
+    if _solvers is None:
+        # "spawn": o processo do servidor tem threads, que um fork não copiaria
+        _solvers = ProcessPoolExecutor(
+            max(1, (os.cpu_count() or 1) - 1), mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _solvers
+
+
+def close_solver_pool():
+    """Larga o pool depois de um processo morrer; a próxima estimativa começa outro."""
+    global _solvers
+    if _solvers is not None:
+        _solvers.shutdown(wait=False, cancel_futures=True)
+        _solvers = None
+
+
+def solve_status(game, max_nodes):
+    """Decide uma amostra; corre nos processos do pool."""
+    return solve(game, max_nodes).status
+
+
+class Position:
+    """A posição conhecida do jogo e os lugares das cartas desconhecidas."""
+
+    def __init__(self, game):
+        self.game = game.copy()
+        self.draw = game.waste_size
+        self.passes = game.passes_remaining
+        self.tableau = np.full((len(TABLEAU), MAX_COLUMN), -1, np.int16)
+        self.lengths = np.zeros(len(TABLEAU), np.int16)
+        self.hidden = np.zeros(len(TABLEAU), np.int16)
+        unknown = []
+        columns = []
+        rows = []
+        for column, pile in enumerate(TABLEAU):
+            cards = game.piles[pile]
+            self.lengths[column] = len(cards)
+            for row, card in enumerate(cards):
+                if game.face_up[card]:
+                    self.tableau[column, row] = card
+                else:
+                    unknown.append(card)
+                    columns.append(column)
+                    rows.append(row)
+                    self.hidden[column] += 1
+        # O talon tem o waste (de baixo para cima) e depois o stock pela ordem em que sai
+        waste = game.piles[WASTE]
+        stock = game.piles[STOCK]
+        self.talon = np.full(MAX_TALON, -1, np.int16)
+        self.talon[:len(waste)] = waste
+        self.talon_length = len(waste) + len(stock)
+        self.waste_length = len(waste)
+        unknown.extend(stock)
+        self.unknown = np.array(unknown, np.int16)
+        self.columns = np.array(columns, np.intp)
+        self.rows = np.array(rows, np.intp)
+        self.talon_slots = np.arange(len(waste), self.talon_length)
+        self.foundation = np.array(game.foundation_levels(), np.int16)
+
+    def sample(self, count, rng):
+        """Distribuições das cartas desconhecidas, uma por linha."""
+        order = np.argsort(rng.random((count, len(self.unknown))), axis=1)
+        return self.unknown[order]
+
+    def sample_game(self, sampled):
+        """O ``Game`` com as cartas desconhecidas nos lugares de uma linha de ``sample``."""
+        piles = [list(cards) for cards in self.game.piles]
+        hidden_count = len(self.columns)
+        for column, row, card in zip(self.columns.tolist(), self.rows.tolist(), sampled[:hidden_count].tolist()):
+            piles[TABLEAU[column]][row] = card
+        # O talon tem o stock pela ordem em que sai; a pilha guarda-o de baixo para cima
+        piles[STOCK] = sampled[hidden_count:].tolist()[::-1]
+        game = Game(self.game.waste_size, self.game.passes_remaining)
+        game.load(piles, self.game.face_up)
+        return game
+
+
+def can_place_on_tableau(cards, tops):
+    """Regra do tableau (``game.can_place_on_tableau``) para arrays de cartas."""
+    king_on_empty = (tops < 0) & (cards % 13 == 12)
+    stacked = (tops >= 0) & ((cards < 26) != (tops < 26)) & (tops % 13 - cards % 13 == 1)
+    return (cards >= 0) & (king_on_empty | stacked)
+
+
+def rollout(position, sampled, max_steps=500):
+    """Joga as distribuições ``sampled`` (de ``Position.sample``) com a política gulosa; devolve quais ganharam."""
+    k = len(sampled)
+    games = np.arange(k)
+    columns = np.arange(len(TABLEAU))
+
+    hidden_count = len(position.columns)
+    tableau = np.repeat(position.tableau[None], k, axis=0)
+    tableau[:, position.columns, position.rows] = sampled[:, :hidden_count]
+    talon = np.repeat(position.talon[None], k, axis=0)
+    talon[:, position.talon_slots] = sampled[:, hidden_count:]
+
+    lengths = np.repeat(position.lengths[None], k, axis=0)
+    hidden = np.repeat(position.hidden[None], k, axis=0)
+    foundation = np.repeat(position.foundation[None], k, axis=0)
+    talon_length = np.full(k, position.talon_length, np.int16)
+    waste = np.full(k, position.waste_length, np.int16)  # Cartas do talon já no waste
+    passes = np.full(k, position.passes)
+    idle = np.zeros(k, np.int16)  # Passos seguidos só a tirar do baralho
+    active = np.ones(k, bool)
+    offsets = np.arange(MAX_TALON)
+
+    def to_foundation(cards, rows):
+        return (cards >= 0) & (foundation[rows, np.maximum(cards, 0) // 13] == cards % 13)
+
+    def pop_waste(rows):
+        """Tira a carta do topo do waste das linhas dadas."""
+        top = waste[rows, None] - 1
+        source = np.minimum(np.where(offsets >= top, offsets + 1, offsets), MAX_TALON - 1)
+        talon[rows] = np.take_along_axis(talon[rows], source, axis=1)
+        talon[rows, talon_length[rows] - 1] = -1
+        talon_length[rows] -= 1
+        waste[rows] -= 1
+
+    for _ in range(max_steps):
+        active &= foundation.sum(axis=1) < 52
+        if not active.any():
+            break
+        tops = np.where(lengths > 0, tableau[games[:, None], columns, np.maximum(lengths - 1, 0)], -1)
+        waste_top = np.where(waste > 0, talon[games, np.maximum(waste - 1, 0)], -1)
+        waste_top[~active] = -1
+        tops[~active] = -1
+
+        # 1. Do waste para a fundação
+        waste_found = to_foundation(waste_top, games)
+        # 2. Do tableau para a fundação
+        tableau_found = to_foundation(tops, games[:, None])
+        # 3. Sequências que destapam uma carta (a base da sequência sobre outra coluna)
+        bases = np.where(
+            (hidden > 0) & (lengths > hidden),
+            tableau[games[:, None], columns, np.minimum(hidden, MAX_COLUMN - 1)],
+            -1,
+        )
+        runs = can_place_on_tableau(bases[:, :, None], tops[:, None, :])
+        runs &= ~np.eye(len(TABLEAU), dtype=bool)
+        # 4. Do waste para o tableau
+        waste_tableau = can_place_on_tableau(waste_top[:, None], tops)
+
+        first = active & waste_found
+        second = active & ~first & tableau_found.any(axis=1)
+        third = active & ~first & ~second & runs.any(axis=(1, 2))
+        fourth = active & ~first & ~second & ~third & waste_tableau.any(axis=1)
+        fifth = active & ~first & ~second & ~third & ~fourth
+
+        rows = np.nonzero(first)[0]
+        if len(rows):
+            cards = waste_top[rows]
+            foundation[rows, cards // 13] += 1
+            pop_waste(rows)
+
+        rows = np.nonzero(second)[0]
+        if len(rows):
+            column = tableau_found[rows].argmax(axis=1)
+            cards = tops[rows, column]
+            foundation[rows, cards // 13] += 1
+            lengths[rows, column] -= 1
+            tableau[rows, column, lengths[rows, column]] = -1
+
+        rows = np.nonzero(third)[0]
+        if len(rows):
+            # As colunas com mais cartas escondidas primeiro
+            weight = runs[rows] * (hidden[rows, :, None] + 1)
+            choice = weight.reshape(len(rows), -1).argmax(axis=1)
+            src, dst = np.divmod(choice, len(TABLEAU))
+            start = hidden[rows, src]
+            count = lengths[rows, src] - start
+            end = lengths[rows, dst]
+            for offset in range(13):
+                moving = offset < count
+                if not moving.any():
+                    break
+                r, s, d = rows[moving], src[moving], dst[moving]
+                tableau[r, d, end[moving] + offset] = tableau[r, s, start[moving] + offset]
+                tableau[r, s, start[moving] + offset] = -1
+            lengths[rows, dst] += count
+            lengths[rows, src] = start
+
+        rows = np.nonzero(fourth)[0]
+        if len(rows):
+            column = waste_tableau[rows].argmax(axis=1)
+            tableau[rows, column, lengths[rows, column]] = waste_top[rows]
+            lengths[rows, column] += 1
+            pop_waste(rows)
+
+        idle[first | second | third | fourth] = 0
+        rows = np.nonzero(fifth)[0]
+        if len(rows):
+            drawing = waste[rows] < talon_length[rows]
+            recycling = ~drawing & (passes[rows] > 1) & (talon_length[rows] > 0)
+            draw_rows = rows[drawing]
+            waste[draw_rows] = np.minimum(waste[draw_rows] + position.draw, talon_length[draw_rows])
+            recycle_rows = rows[recycling]
+            waste[recycle_rows] = 0
+            passes[recycle_rows] -= 1
+            idle[rows] += 1
+            active[rows[~drawing & ~recycling]] = False
+            # Um ciclo inteiro do baralho sem nenhuma outra jogada: não há mais nada a fazer
+            cycle = (talon_length[rows] + position.draw - 1) // position.draw + 2
+            active[rows[idle[rows] > cycle]] = False
+
+        # Vira a carta que ficou destapada em cada coluna
+        hidden = np.where(hidden >= lengths, np.maximum(lengths - 1, 0), hidden)
+
+    return foundation.sum(axis=1) == 52
+
+
+def estimate(game, budget=0.2, batch=256, rng=None, max_nodes=300, solver_samples=SOLVER_SAMPLES):
+    """Estima a probabilidade de ganhar dentro do tempo dado.
+
+    Um lote de ``batch`` amostras é jogado pela política; das que ela perde,
+    ``solver_samples`` ao acaso vão para o solver, e as que não ficam decididas
+    até ao fim do tempo contam como ``UNDECIDED``. Devolve um
+    ``OddsEstimate``, ou None se o NumPy não estiver instalado.
+    """
+    if np is None:
+        return None
+    if game.is_won():
+        return OddsEstimate(1.0, 0)
+    deadline = time.perf_counter() + budget
+    rng = rng or np.random.default_rng()
+    position = Position(game)
+    sampled = position.sample(batch, rng)
+    won = rollout(position, sampled)
+    lost = np.nonzero(~won)[0]
+    if not len(lost):
+        return OddsEstimate(1.0, batch)
+    checked = rng.choice(lost, min(len(lost), solver_samples), replace=False)
+    try:
+        pool = solver_pool()
+        futures = [pool.submit(solve_status, position.sample_game(sampled[row]), max_nodes) for row in checked]
+    except BrokenProcessPool:
+        close_solver_pool()
+        futures = []
+    # O thread só espera pelos processos: não compete com as sessões pelo GIL
+    done, pending = wait(futures, timeout=max(0.0, deadline - time.perf_counter()))
+    for future in pending:
+        future.cancel()
+    statuses = [future.result() for future in done if future.exception() is None]
+    if len(statuses) < len(done):
+        close_solver_pool()
+    solved = statuses.count(SOLVED)
+    undecided = len(checked) - solved - statuses.count(UNWINNABLE)
+    rescued = (solved + UNDECIDED * undecided) / len(checked)
+    return OddsEstimate((int(won.sum()) + len(lost) * rescued) / batch, batch)
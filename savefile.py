@@ -0,0 +1,154 @@
+"""Formato binário dos jogos salvos e escrita atómica em segundo plano.
+
+Formato (versão 1, little-endian):
+
+    b"KSV", versão (u8), waste_size (u8), passagens restantes (u16),
+    pontuação (i32), tempo restante (u16), seed (u32),
+    13 x tamanho da pilha (u8),
+    52 x carta (u8: identificador, com o bit 0x80 se estiver virada para cima)
+
+As cartas vêm pilha a pilha, pela ordem do ``Game``. Os ficheiros JSON do
+formato antigo (``saved_game.json``) continuam a poder ser carregados.
+
+Cada cliente tem a sua pasta de slots, com o identificador que o browser
+guarda: um jogador não vê nem substitui os jogos salvos dos outros.
+"""
+import json
+import os
+import re
+import struct
+import threading
+import tempfile
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from game import CARD_IDS, DECK_SIZE, FOUNDATION, PILE_COUNT, STOCK, TABLEAU, WASTE
+
+MAGIC = b"KSV"
+VERSION = 1
+HEADER = struct.Struct("<3sBBHiHI")
+FACE_UP = 0x80
+CLIENT_ID = re.compile(r"[0-9a-f]{32}")  # uuid4().hex; o identificador vem do cliente
+SLOT_NAME = re.compile(r"\w{1,32}")
+
+SavedGame = namedtuple("SavedGame", "piles face_up waste_size passes_remaining score time_remaining seed")
+
+# Um único thread faz todas as escritas, pela ordem em que foram pedidas
+_io = ThreadPoolExecutor(max_workers=1, thread_name_prefix="solitaire-save")
+_pending = {}  # Dados das escritas por terminar, por ficheiro
+_lock = threading.Lock()
+
+
+def encode(game, score=0, time_remaining=0, seed=None):
+    header = HEADER.pack(
+        MAGIC, VERSION, game.waste_size, min(game.passes_remaining, 0xFFFF),
+        score, time_remaining, (seed or 0) & 0xFFFFFFFF,
+    )
+    lengths = bytes(len(pile) for pile in game.piles)
+    cards = bytes(card | (FACE_UP if game.face_up[card] else 0) for pile in game.piles for card in pile)
+    return header + lengths + cards
+
+
+def decode(data):
+    """Lê um jogo salvo, no formato binário ou no JSON antigo."""
+    if data.lstrip()[:1] == b"{":
+        return decode_json(json.loads(data))
+    magic, version, waste_size, passes, score, time_remaining, seed = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Ficheiro de jogo salvo inválido")
+    offset = HEADER.size
+    lengths = data[offset:offset + PILE_COUNT]
+    offset += PILE_COUNT
+    piles = []
+    face_up = bytearray(DECK_SIZE)
+    for length in lengths:
+        pile = []
+        for value in data[offset:offset + length]:
+            card = value & 0x7F
+            pile.append(card)
+            face_up[card] = 1 if value & FACE_UP else 0
+        piles.append(pile)
+        offset += length
+    return SavedGame(piles, face_up, waste_size, passes, score, time_remaining, seed)
+
+
+def decode_json(state):
+    """Converte o estado no formato JSON (nomes das cartas e booleanos)."""
+    piles = [[] for _ in range(PILE_COUNT)]
+    face_up = bytearray(DECK_SIZE)
+
+    def add_cards(pile, cards):
+        for card_data in cards:
+            if isinstance(card_data, list) and len(card_data) == 2:  # Novo formato: [card_name, face_up]
+                card_name, card_face_up = card_data
+            else:  # Formato antigo: apenas card_name
+                card_name = card_data
+                card_face_up = False  # Assume que a carta estava virada para baixo
+            card = CARD_IDS[card_name]
+            piles[pile].append(card)
+            face_up[card] = bool(card_face_up)
+
+    add_cards(STOCK, state["stock"])
+    add_cards(WASTE, state["waste"])
+    for pile, cards in zip(FOUNDATION, state["foundation"]):
+        add_cards(pile, cards)
+    for pile, cards in zip(TABLEAU, state["tableau"]):
+        add_cards(pile, cards)
+    return SavedGame(piles, face_up, None, None, None, None, None)
+
+
+def write_atomic(path, data):
+    """Escreve num ficheiro temporário e troca-o pelo destino de uma só vez."""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".save-")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def read_file(path):
+    with open(path, "rb") as file:
+        return file.read()
+
+
+def save_async(path, data):
+    """Agenda a escrita fora do thread da interface; devolve um ``Future``."""
+    with _lock:
+        _pending[path] = data
+    future = _io.submit(write_atomic, path, data)
+
+    def written(future):
+        with _lock:
+            if _pending.get(path) is data:
+                del _pending[path]
+
+    future.add_done_callback(written)
+    return future
+
+
+def load(path):
+    """Lê e descodifica um jogo salvo, sem esperar pelas escritas dos outros ficheiros.
+
+    A troca do ``write_atomic`` faz a leitura ver o ficheiro antigo ou o novo,
+    nunca metade; se a escrita deste ficheiro ainda não terminou, os dados
+    vêm da escrita pendente.
+    """
+    with _lock:
+        data = _pending.get(path)
+    return decode(data if data is not None else read_file(path))
+
+
+def slot_path(directory, client_id, slot):
+    """Ficheiro do slot ``slot`` do cliente ``client_id``; os dois vêm do cliente e são validados."""
+    if not isinstance(client_id, str) or not CLIENT_ID.fullmatch(client_id):
+        raise ValueError("Identificador de cliente inválido")
+    if not isinstance(slot, str) or not SLOT_NAME.fullmatch(slot):
+        raise ValueError("Nome de slot inválido")
+    return os.path.join(directory, client_id, f"{slot}.sav")
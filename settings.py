@@ -1,10 +1,29 @@
 import flet as ft
 
 class Settings:
-    def __init__(self, waste_size=3, deck_passes_allowed=1000, card_back=f"/images/card_back0.png"):
+    def __init__(self, waste_size=3, deck_passes_allowed=1000, card_back=f"/images/card_back0.png", history_limit=500, winnable_only=False, deal_library="deals.bin", auto_complete=True, auto_move_safe=False, drag_frame_ms=33, save_dir="saves", metrics_dir=None, metrics_interval=10, card_atlas="assets/cache/cards.json", stats_db="stats.db", show_odds=False, odds_budget=0.2, compact_piles=True, animate_cards=True, animation_ms=200, journal_dir="saves/journal", journal_checkpoint_every=200, journal_max_age=7 * 86400):
         self.waste_size = waste_size
         self.deck_passes_allowed = deck_passes_allowed
         self.card_back = card_back
+        self.history_limit = history_limit  # Número máximo de jogadas que podem ser desfeitas
+        self.winnable_only = winnable_only  # Só distribui jogos que a biblioteca marca como ganháveis
+        self.deal_library = deal_library  # Ficheiro criado pelo deals.py
+        self.auto_complete = auto_complete  # Termina sozinho um jogo já resolvido
+        self.auto_move_safe = auto_move_safe  # Leva para a fundação as cartas que já não fazem falta
+        self.drag_frame_ms = drag_frame_ms  # Ritmo dos eventos de arrasto do cliente; o servidor envia no máximo o dobro (0 = todas)
+        self.save_dir = save_dir  # Pasta com um ficheiro por slot de jogo salvo
+        self.metrics_dir = metrics_dir  # Pasta para as métricas de cada sessão (None = desligadas)
+        self.metrics_interval = metrics_interval  # Segundos entre escritas do ficheiro de métricas
+        self.card_atlas = card_atlas  # Manifesto criado pelo card_assets.py
+        self.stats_db = stats_db  # Base de dados das estatísticas (None = não registar)
+        self.show_odds = show_odds  # Mostra a probabilidade estimada de ganhar (precisa do NumPy)
+        self.odds_budget = odds_budget  # Segundos de simulação por estimativa
+        self.compact_piles = compact_piles  # Desenha as cartas viradas para baixo de cada pilha como uma só
+        self.animate_cards = animate_cards  # O cliente anima a distribuição e os movimentos das cartas
+        self.animation_ms = animation_ms  # Duração de cada movimento animado
+        self.journal_dir = journal_dir  # Diários dos jogos em curso, retomados ao abrir a página (None = desligado)
+        self.journal_checkpoint_every = journal_checkpoint_every  # Ações entre checkpoints do diário
+        self.journal_max_age = journal_max_age  # Segundos sem jogar até o diário de um jogo ser apagado
 
 
 class SettingsDialog(ft.AlertDialog):
@@ -22,6 +41,11 @@ class SettingsDialog(ft.AlertDialog):
             ft.Radio(value=3, label="Three"),
             ft.Radio(value=1000, label="Unlimited"),
         ]))
+        self.winnable_only = ft.Checkbox(label="Only winnable deals", value=self.settings.winnable_only)
+        self.auto_move_safe = ft.Checkbox(label="Auto-move safe cards to foundation", value=self.settings.auto_move_safe)
+        self.show_odds = ft.Checkbox(label="Show win odds", value=self.settings.show_odds)
+        self.compact_piles = ft.Checkbox(label="Compact face-down piles", value=self.settings.compact_piles)
+        self.animate_cards = ft.Checkbox(label="Animate cards", value=self.settings.animate_cards)
         self.generate_card_backs()
 
 
@@ -30,6 +54,11 @@ class SettingsDialog(ft.AlertDialog):
             self.waste_size,
             ft.Text("Passes through the deck:"),
             self.deck_passes_allowed,
+            self.winnable_only,
+            self.auto_move_safe,
+            self.show_odds,
+            self.compact_piles,
+            self.animate_cards,
             ft.Row(controls=self.card_backs),
             ft.Checkbox(label="New game will be started when settings are updated.", value=True, disabled=True),
             ], 
@@ -59,6 +88,11 @@ class SettingsDialog(ft.AlertDialog):
     def cancel(self, e):
         self.waste_size.value = self.settings.waste_size
         self.deck_passes_allowed.value = self.settings.deck_passes_allowed
+        self.winnable_only.value = self.settings.winnable_only
+        self.auto_move_safe.value = self.settings.auto_move_safe
+        self.show_odds.value = self.settings.show_odds
+        self.compact_piles.value = self.settings.compact_piles
+        self.animate_cards.value = self.settings.animate_cards
         self.open = False
         self.update()
 
@@ -66,6 +100,11 @@ class SettingsDialog(ft.AlertDialog):
         self.open = False
         self.settings.waste_size = int(self.waste_size.value)
         self.settings.deck_passes_allowed = int(self.deck_passes_allowed.value)
+        self.settings.winnable_only = bool(self.winnable_only.value)
+        self.settings.auto_move_safe = bool(self.auto_move_safe.value)
+        self.settings.show_odds = bool(self.show_odds.value)
+        self.settings.compact_piles = bool(self.compact_piles.value)
+        self.settings.animate_cards = bool(self.animate_cards.value)
         self.settings.card_back = self.selected_card.content.src
         self.on_settings_applied(self.settings)
         self.update()
@@ -1,10 +1,11 @@
 import flet as ft
+from metrics import timed
 
 class Slot(ft.Container):
-    def __init__(self, solitaire, slot_type, top, left, border):
+    def __init__(self, solitaire, slot_type, index, top, left, border):
         super().__init__()
         self.solitaire = solitaire
-        self.pile = []
+        self.index = index  # Índice da pilha no estado do jogo
         self.type = slot_type
         self.width = 70
         self.height = 100
@@ -14,13 +15,20 @@ class Slot(ft.Container):
         self.border = border
         self.on_click = self.click
 
+    @property
+    def pile(self):
+        """Cartas da pilha, de baixo para cima, como controles."""
+        cards = self.solitaire.cards
+        return [cards[card_id] for card_id in self.solitaire.game.piles[self.index]]
+
     def get_top_card(self):
-        if len(self.pile) > 0:
-            return self.pile[-1]
+        card_id = self.solitaire.game.top(self.index)
+        if card_id is not None:
+            return self.solitaire.cards[card_id]
 
     def get_top_three_cards(self):
-        n = len(self.pile)
-        return self.pile[max(0, n-3):]
+        cards = self.solitaire.cards
+        return [cards[card_id] for card_id in self.solitaire.game.piles[self.index][-3:]]
 
     def fan_top_three(self):
         for i, card in enumerate(self.get_top_three_cards()):
@@ -29,11 +37,37 @@ class Slot(ft.Container):
 
     def upper_card_top(self):
         if self.type == "tableau":
-            if len(self.pile) > 1:
-                return self.top + self.solitaire.card_offset * (len(self.pile) - 1)
+            n = len(self.solitaire.game.piles[self.index])
+            if n > 1:
+                return self.top + self.solitaire.card_offset * (n - 1)
         return self.top
 
+    @timed("stock_click")
     def click(self, e):
-        if self.type == "stock" and self.solitaire.deck_passes_remaining > 1:
-            self.solitaire.deck_passes_remaining -= 1
-            self.solitaire.restart_stock()
+        with self.solitaire.batch():
+            if self.type == "stock" and self.solitaire.game.can_recycle():
+                self.solitaire.restart_stock()
+
+
+class DropTargets:
+    """Índice espacial dos slots onde as cartas podem ser largadas.
+
+    Os slots são agrupados em faixas verticais da largura da tolerância, de
+    modo que, para uma posição, só se comparam os slots da faixa respetiva.
+    """
+
+    def __init__(self, slots, tolerance=40):
+        self.tolerance = tolerance
+        self.cells = {}
+        for slot in slots:
+            first = int((slot.left - tolerance) // tolerance)
+            last = int((slot.left + tolerance) // tolerance)
+            for cell in range(first, last + 1):
+                self.cells.setdefault(cell, []).append(slot)
+
+    def find(self, top, left):
+        """Slots cuja carta do topo está perto da posição dada, pela ordem em que foram indexados."""
+        return [
+            slot for slot in self.cells.get(int(left // self.tolerance), ())
+            if abs(top - slot.upper_card_top()) < self.tolerance and abs(left - slot.left) < self.tolerance
+        ]
@@ -1,72 +1,267 @@
-from card import Card
-from slot import Slot
+from card import Card, CardControls, CardPile
+from slot import DropTargets, Slot
+from history import History
+from movelog import MoveRecorder, delta_points
+from solver import UNWINNABLE, hint
+from deals import daily_seed, open_library
+from clock import scheduler
+from metrics import Metrics, MetricsOverlay, timed
+from events import CardMoved, CardRevealed, EventBus, GameWon, ScoreChanged, StockRecycled
+from stats import GameResult, open_stats
+from journal import GameJournal
+import journal
+import savefile
+import odds
+from game import (
+    CARD_NAMES, FOUNDATION, STOCK, TABLEAU, WASTE, Game,
+    can_place_on_foundation, can_place_on_tableau, shuffled_deck,
+)
 import random
+from contextlib import contextmanager
 import flet as ft
-import json
-import time
+import os
+import functools
 import threading
+import time
+import uuid
+
+LEGACY_SAVE = "saved_game.json"  # Ficheiro do formato JSON antigo
+DEAL_STAGGER_MS = 25  # Cada carta distribuída chega este tempo depois da anterior
+
 
-class Suite:
-    def __init__(self, suite_name, suite_color):
-        self.name = suite_name
-        self.color = suite_color
+def record_expired(stats_db, recovered):
+    """Regista como abandonado um jogo por terminar cujo diário expirou sem ser retomado."""
+    saved = recovered.saved
+    if recovered.moves:
+        open_stats(stats_db).record(GameResult(
+            saved.seed, saved.waste_size, False, saved.score, recovered.seconds, recovered.moves, time.time(),
+        ))
 
-class Rank:
-    def __init__(self, card_name, card_value):
-        self.name = card_name
-        self.value = card_value
 
 class Solitaire(ft.Stack):
-    def __init__(self, settings, on_win):
+    def __init__(self, settings, on_win, seed=None, journal_id=None, daily=False, client_id=None):
         super().__init__()
-        self.history = []  # Lista para armazenar os estados do jogo
+        self.seed = seed  # Seed do jogo; o mesmo valor dá sempre o mesmo jogo
+        self.daily = daily  # Jogo do dia, o mesmo para todos os jogadores com as mesmas regras
+        self.resume_id = journal_id  # Jogo por terminar deste cliente, retomado se o diário o tiver
+        # Dono dos jogos salvos; sem o identificador do browser, só esta sessão os vê
+        self.client_id = client_id or uuid.uuid4().hex
+        self.journal = None  # Diário das jogadas, para retomar o jogo depois de uma falha
         self.settings = settings
+        self.history = History(settings.history_limit)  # Deltas das jogadas para desfazer
+        self.move_log = None  # Jogadas da partida, desde a distribuição
         self.timer_running = False
         self.time_remaining = 300  # 5 minutos em segundos
         self.timer_text = None  # Referência ao texto do temporizador
-        self.timer_thread = None
         self.score = 0
         self.score_text = None  # Referência ao texto da pontuação
+        self.odds_text = None  # Referência ao texto das hipóteses de ganhar
+        self.odds_generation = 0  # Muda a cada jogada; as estimativas antigas são descartadas
+        self.odds_stale = False  # Houve jogadas na transação aberta; a estimativa é pedida no fim
         self.width = 1000
         self.height = 500
         self.current_top = 0
         self.current_left = 0
         self.card_offset = 20
         self.settings = settings
-        self.deck_passes_remaining = int(self.settings.deck_passes_allowed)
+        # As posições mudam no servidor e o cliente anima o movimento, sem mensagens por frame
+        self.animation = ft.Animation(settings.animation_ms, ft.AnimationCurve.EASE_OUT) if settings.animate_cards else None
+        self.game = Game(self.settings.waste_size, int(self.settings.deck_passes_allowed))
+        # Cada consumidor subscreve só os eventos de que precisa
+        self.events = EventBus()
+        self.game.events = self.events
+        self.event_counts = {}  # Eventos de cada tipo nesta sessão
+        for event_type in (CardMoved, CardRevealed, StockRecycled, ScoreChanged, GameWon):
+            self.events.subscribe(event_type, self.count_event)
+        self.events.subscribe(CardMoved, self.render_moved)
+        self.events.subscribe(CardMoved, self.score_move)
+        self.events.subscribe(CardMoved, self.check_win)
+        self.events.subscribe(CardRevealed, self.render_revealed)
+        self.events.subscribe(StockRecycled, self.render_stock)
+        self.events.subscribe(ScoreChanged, self.show_score)
+        self.events.subscribe(GameWon, lambda event: self.on_win())
+        self.events.subscribe(GameWon, lambda event: self.win_callback())
+        self.events.subscribe(GameWon, lambda event: self.record_result(won=True))
+        self.events.subscribe(GameWon, lambda event: self.end_journal())
+        self.result_recorded = False
+        self.started_at = time.monotonic()  # Para o tempo de jogo nas estatísticas
+        self.earlier_seconds = 0  # Tempo de jogo e jogadas das sessões anteriores de um jogo retomado
+        self.earlier_moves = 0
         self.controls = []
-        self.on_win = on_win
+        self.card_piles = []  # Pilhas compactas das cartas viradas para baixo, se ligadas
+        self.win_callback = on_win  # Chamada depois de somado o bónus de tempo
+        self.batch_depth = 0  # Transações abertas; as atualizações são adiadas enquanto > 0
+        self.dirty_controls = []  # Controles a enviar no fim da transação
+        self.update_count = 0  # Total de atualizações enviadas ao cliente
+        self.last_action_updates = 0  # Atualizações enviadas pela última ação
+        self.drag_updates = 0  # Atualizações enviadas durante o arrasto atual
+        self.last_drag_update = 0.0
+        self.pending_drag = None  # Cartas arrastadas com uma posição ainda por enviar
+        self.drag_scheduled = False  # Se o envio da posição retida já está agendado
+        # Handlers, arrasto, relógio e hipóteses alteram o tabuleiro um de cada vez
+        self.lock = threading.RLock()
+        self.now = time.perf_counter  # Relógio do arrasto; o bench usa um relógio falso
+        # Instrumentação: ligada pelas configurações ou pelo painel da barra
+        self.metrics = Metrics() if settings.metrics_dir else None
+        self.metrics_overlay = None
+        self.metrics_ticks = 0
 
     def did_mount(self):
-        self.create_slots()
-        self.create_card_deck()
-        self.deal_cards()
+        with self.batch():
+            self.create_slots()
+            # O jogo por terminar é procurado primeiro: um jogo retomado não é baralhado nem distribuído
+            recovered = self.find_journal(self.resume_id)
+            self.create_card_deck(recovered.saved if recovered is not None else None)
+            if recovered is None:
+                self.deal_cards()
+                self.start_journal()
+            else:
+                self.resume_journal(recovered)
+            dealt = self.gather_deal() if self.animation and recovered is None else []
+        if dealt:
+            self.spread_deal(dealt)
+        if self.metrics is not None:
+            scheduler.add(self.report_metrics)
+
+    @contextmanager
+    def batch(self):
+        """Agrupa todas as alterações de uma ação numa única atualização do cliente."""
+        with self.lock:
+            if self.batch_depth == 0:
+                start = self.update_count
+            self.batch_depth += 1
+            try:
+                yield
+            finally:
+                if self.batch_depth == 1 and self.odds_stale:
+                    # Uma só estimativa por ação, com o tabuleiro final
+                    self.odds_stale = False
+                    self.refresh_odds()
+                self.batch_depth -= 1
+                if self.batch_depth == 0:
+                    if self.dirty_controls:
+                        controls = self.dirty_controls
+                        self.dirty_controls = []
+                        self.send_update(controls)
+                    self.last_action_updates = self.update_count - start
+
+    def update(self, *controls):
+        """Atualiza o tabuleiro (ou os controles dados), adiando dentro de uma transação."""
+        controls = controls or (self,)
+        with self.lock:
+            if self.batch_depth > 0:
+                for control in controls:
+                    if control not in self.dirty_controls:
+                        self.dirty_controls.append(control)
+                return
+            self.send_update(controls)
+
+    @timed("update")
+    def send_update(self, controls):
+        if self.card_piles:
+            controls = self.sync_piles(controls)
+        self.update_count += 1
+        self.page.update(*controls)
+
+    def sync_piles(self, controls):
+        """Acompanha as pilhas compactas e tira da lista o que a atualização do tabuleiro já envia."""
+        controls = list(controls) + [pile for pile in self.card_piles if pile.refresh()]
+        if self in controls:
+            # O tabuleiro envia todas as cartas e pilhas, incluindo as que acabaram de entrar
+            return [self] + [control for control in controls if not isinstance(control, (Card, CardPile))]
+        return [control for control in controls if not isinstance(control, Card) or control.attached]
+
+    def attach(self, card):
+        """Cria o controle da carta na página, por cima das outras, quando ela fica visível."""
+        if not card.attached:
+            card.attached = True
+            self.controls.append(card)
+            self.update()
 
     def update_card_backs(self):
         """Atualiza as costas das cartas com base nas configurações."""
-        for card in self.cards:
-            if not card.face_up:  # Apenas atualiza as cartas viradas para baixo
-                card.content.content.src = self.settings.card_back
-        self.update()  # Atualiza a interface
+        with self.batch():
+            for pile in self.card_piles:
+                pile.show_image(self.settings.card_back)
+            for card in self.cards.created():
+                if not card.face_up:  # Apenas atualiza as cartas viradas para baixo
+                    card.show_image(self.settings.card_back)
+            self.update()  # Atualiza a interface
 
     def start_timer(self):
-        """Inicia o temporizador em uma thread separada."""
-        if self.timer_thread and self.timer_thread.is_alive():
+        """Regista o temporizador no relógio partilhado do processo."""
+        if self.timer_running:
             return  # Evita iniciar múltiplos temporizadores
 
         self.timer_running = True
-        self.timer_thread = threading.Thread(target=self.run_timer, daemon=True)
-        self.timer_thread.start()
+        scheduler.add(self.tick)
 
-    def run_timer(self):
-        """Executa o temporizador."""
-        while self.timer_running and self.time_remaining > 0:
-            time.sleep(1)
+    def stop_timer(self):
+        """Para o temporizador deste jogo."""
+        self.timer_running = False
+        scheduler.remove(self.tick)
+
+    @timed("tick")
+    def tick(self):
+        """Avança o temporizador um segundo; chamado pelo relógio partilhado."""
+        if self.time_remaining > 0:
             self.time_remaining -= 1
             self.update_timer_display()  # Atualiza o display do temporizador
-            if self.time_remaining == 0:
-                self.on_timeout()
-                break
+        if self.time_remaining == 0:
+            self.on_timeout()
+
+    def on_timeout(self):
+        """Termina o jogo quando o tempo acaba."""
+        self.stop_timer()
+        print("Tempo esgotado!")
+        self.record_result(won=False)
+        self.end_journal()
+
+    def will_unmount(self):
+        # Um jogo removido da página não pode continuar a contar o tempo
+        self.stop_timer()
+        if self.journal is not None:
+            # A sessão fechou: o jogo fica no diário para ser retomado, com o tempo e as jogadas até agora
+            self.checkpoint_journal()
+            self.journal.close()
+        else:
+            self.record_result(won=False)  # Jogo abandonado
+        scheduler.remove(self.report_metrics)
+        if self.metrics is not None and self.settings.metrics_dir:
+            self.flush_metrics()
+
+    def toggle_metrics(self):
+        """Mostra ou esconde o painel de desempenho, ligando a instrumentação se preciso."""
+        if self.metrics_overlay is None:
+            if self.metrics is None:
+                self.metrics = Metrics()
+            self.metrics_overlay = MetricsOverlay()
+            self.page.overlay.append(self.metrics_overlay)
+            scheduler.add(self.report_metrics)
+            self.page.update()
+            self.metrics_overlay.show(self.metrics)
+        else:
+            self.page.overlay.remove(self.metrics_overlay)
+            self.metrics_overlay = None
+            if not self.settings.metrics_dir:
+                # Só estava ligada para o painel
+                self.metrics = None
+                scheduler.remove(self.report_metrics)
+            self.page.update()
+
+    def report_metrics(self):
+        """Chamado pelo relógio partilhado: atualiza o painel e escreve o ficheiro de métricas."""
+        if self.metrics_overlay is not None:
+            self.metrics_overlay.show(self.metrics)
+        if self.settings.metrics_dir:
+            self.metrics_ticks += 1
+            if self.metrics_ticks % self.settings.metrics_interval == 0:
+                self.flush_metrics()
+
+    def flush_metrics(self):
+        session = self.page.session_id if self.page else None
+        path = os.path.join(self.settings.metrics_dir, f"{session or id(self)}.json")
+        savefile.save_async(path, self.metrics.to_json(session))
 
     def update_timer_display(self):
         """Atualiza o display do temporizador."""
@@ -74,14 +269,45 @@ class Solitaire(ft.Stack):
         seconds = self.time_remaining % 60
         if self.timer_text:
             self.timer_text.value = f"Tempo: {minutes:02}:{seconds:02}"
-            self.update()  # Atualiza a interface
+            self.update(self.timer_text)  # Só o texto do temporizador muda
 
     def update_score(self, points):
         """Atualiza a pontuação."""
         self.score += points
+        self.events.emit(ScoreChanged(self.score, points))
+
+    def show_score(self, event):
         if self.score_text:
-            self.score_text.value = f"Pontuação: {self.score}"
-            self.update()  # Atualiza a interface
+            self.score_text.value = f"Pontuação: {event.score}"
+            self.update(self.score_text)  # Só o texto da pontuação muda
+
+    def count_event(self, event):
+        name = type(event).__name__
+        self.event_counts[name] = self.event_counts.get(name, 0) + 1
+
+    def render_moved(self, event):
+        """Redesenha só as cartas movidas."""
+        self.update(*self.render_cards(event.cards))
+
+    def render_revealed(self, event):
+        card = self.cards[event.card]
+        self.render_card(card)
+        self.update(card)
+
+    def render_stock(self, event):
+        cards = self.render_cards(self.game.piles[STOCK])
+        if cards:
+            self.update(*cards)
+
+    def score_move(self, event):
+        # 10 pontos por carta na fundação
+        if event.dst in FOUNDATION:
+            self.update_score(10)
+
+    def check_win(self, event):
+        # Só uma carta que chega à fundação pode terminar o jogo
+        if event.dst in FOUNDATION and self.game.is_won():
+            self.events.emit(GameWon(self.score))
 
     def on_win(self):
         """Calcula a pontuação final ao vencer."""
@@ -90,116 +316,207 @@ class Solitaire(ft.Stack):
         print(f"Você venceu! Pontuação final: {self.score}")
         self.stop_timer()  # Para o temporizador ao vencer
 
-    def save_state(self):
-        """Salva o estado atual do jogo."""
-        state = {
-            "stock": [[f"{card.rank.name}_{card.suite.name}", card.face_up] for card in self.stock.pile],
-            "waste": [[f"{card.rank.name}_{card.suite.name}", card.face_up] for card in self.waste.pile],
-            "foundation": [
-                [[f"{card.rank.name}_{card.suite.name}", card.face_up] for card in slot.pile]
-                for slot in self.foundation
-            ],
-            "tableau": [
-                [[f"{card.rank.name}_{card.suite.name}", card.face_up] for card in slot.pile]
-                for slot in self.tableau
-            ],
-        }
-        self.history.append(state)
-
-    def restore_state(self, state):
-        """Restaura o jogo para um estado específico."""
-        # Limpa todos os slots
-        self.stock.pile.clear()
-        self.waste.pile.clear()
-        for slot in self.foundation:
-            slot.pile.clear()
-        for slot in self.tableau:
-            slot.pile.clear()
-
-        # Mapeia as cartas do jogo atual para facilitar a busca
-        card_map = {f"{card.rank.name}_{card.suite.name}": card for card in self.cards}
-
-        # Função auxiliar para processar cada carta
-        def process_card(card_data, slot):
-            if isinstance(card_data, list) and len(card_data) == 2:  # Novo formato: [card_name, face_up]
-                card_name, face_up = card_data
-            else:  # Formato antigo: apenas card_name
-                card_name = card_data
-                face_up = False  # Assume que a carta estava virada para baixo
-
-            card = card_map[card_name]
-            card.slot = None  # Limpa o slot atual da carta
-            card.place(slot)
-            if face_up:
-                card.turn_face_up()
-            else:
-                card.turn_face_down()
-
-        # Restaura o stock
-        for card_data in state["stock"]:
-            process_card(card_data, self.stock)
-
-        # Restaura o waste
-        for card_data in state["waste"]:
-            process_card(card_data, self.waste)
+    def refresh_odds(self):
+        """Recalcula em segundo plano as hipóteses de ganhar a partir da posição atual."""
+        if self.odds_text is None:
+            return
+        enabled = bool(self.settings.show_odds) and odds.available()
+        if self.odds_text.visible != enabled:
+            self.odds_text.visible = enabled
+            self.update(self.odds_text)
+        if not enabled:
+            return
+        self.odds_generation += 1
+        generation = self.odds_generation
+        game = self.game.copy()
+
+        def estimate():
+            if generation != self.odds_generation:
+                return  # Já houve outra jogada
+            result = odds.estimate(game, self.settings.odds_budget)
+            if generation == self.odds_generation:
+                probability = result.probability
+                self.odds_text.value = "Hipóteses: -" if probability is None else f"Hipóteses: {probability:.0%}"
+                self.update(self.odds_text)
+
+        odds.submit(estimate)
+
+    def request_odds(self):
+        """Pede uma estimativa nova; dentro de uma transação, só no fim dela."""
+        if self.batch_depth > 0:
+            self.odds_stale = True
+        else:
+            self.refresh_odds()
 
-        # Restaura as fundações
-        for i, foundation_pile in enumerate(state["foundation"]):
-            for card_data in foundation_pile:
-                process_card(card_data, self.foundation[i])
+    def played(self):
+        """Segundos de jogo e cartas movidas, contando as sessões anteriores de um jogo retomado."""
+        return (
+            self.earlier_seconds + int(time.monotonic() - self.started_at),
+            self.earlier_moves + self.event_counts.get("CardMoved", 0),
+        )
 
-        # Restaura o tableau
-        for i, tableau_pile in enumerate(state["tableau"]):
-            for card_data in tableau_pile:
-                process_card(card_data, self.tableau[i])
+    def record_result(self, won):
+        """Regista o jogo nas estatísticas, uma única vez e só se o jogador chegou a jogar."""
+        seconds, moves = self.played()
+        if self.result_recorded or not self.settings.stats_db or not moves:
+            return
+        self.result_recorded = True
+        open_stats(self.settings.stats_db).record(GameResult(
+            self.seed, self.game.waste_size, won, self.score, seconds, moves, time.time(),
+        ))
+
+    @property
+    def deck_passes_remaining(self):
+        return self.game.passes_remaining
+
+    def get_state(self):
+        """Devolve o estado atual do jogo no formato JSON."""
+        game = self.game
+
+        def pile_state(pile):
+            return [[CARD_NAMES[card], bool(game.face_up[card])] for card in game.piles[pile]]
+
+        return {
+            "stock": pile_state(STOCK),
+            "waste": pile_state(WASTE),
+            "foundation": [pile_state(pile) for pile in FOUNDATION],
+            "tableau": [pile_state(pile) for pile in TABLEAU],
+        }
 
-        # Atualiza a interface
-        self.update()
+    @timed("save_state")
+    def save_state(self):
+        """Guarda a última jogada no histórico, no registo de jogadas e no diário."""
+        self.move_log.record(self.game.journal)
+        if self.journal is not None and self.journal.record(self.game.journal, self.time_remaining):
+            self.checkpoint_journal()
+        self.history.record(self.game)
+        self.request_odds()
+
+    def start_journal(self, game_id=None, generation=0):
+        """Começa o diário do jogo atual com um checkpoint; o diário do jogo anterior é apagado."""
+        self.end_journal()
+        if self.settings.journal_dir:
+            stats_db = self.settings.stats_db
+            self.journal = GameJournal(
+                self.settings.journal_dir, game_id, generation, self.settings.journal_checkpoint_every,
+                self.settings.journal_max_age, functools.partial(record_expired, stats_db) if stats_db else None,
+            )
+            self.checkpoint_journal()
+
+    @property
+    def journal_id(self):
+        """Identificador do diário do jogo, que o cliente guarda para o retomar."""
+        return self.journal.game_id if self.journal is not None else None
+
+    def checkpoint_journal(self):
+        self.journal.checkpoint(savefile.encode(self.game, self.score, self.time_remaining, self.seed), *self.played())
+
+    def end_journal(self):
+        """O jogo terminou ou foi substituído: o diário já não é preciso."""
+        if self.journal is not None:
+            self.journal.close(delete=True)
+            self.journal = None
+
+    def find_journal(self, game_id):
+        """Recupera do diário o jogo ``game_id``, se ainda estiver por terminar; devolve um ``Recovered`` ou None."""
+        if game_id is None or not self.settings.journal_dir:
+            return None
+        return journal.resume(self.settings.journal_dir, game_id)
+
+    def resume_journal(self, recovered):
+        """Continua o jogo recuperado por ``find_journal``, com o seu diário."""
+        self.history.start(self.game)
+        # O tempo e as jogadas continuam a contar desde o início do jogo
+        self.earlier_seconds, self.earlier_moves = recovered.seconds, recovered.moves
+        self.started_at = time.monotonic()
+        self.restore_saved(recovered.saved, recovered.game_id, recovered.generation)
+        self.history.load(recovered.deltas)  # As jogadas desde o último checkpoint podem ser desfeitas
 
-    def save_game(self, filename="saved_game.json"):
-        """Salva o estado atual do jogo em um arquivo JSON."""
-        state = {
-            "stock": [[f"{card.rank.name}_{card.suite.name}", card.face_up] for card in self.stock.pile],
-            "waste": [[f"{card.rank.name}_{card.suite.name}", card.face_up] for card in self.waste.pile],
-            "foundation": [
-                [[f"{card.rank.name}_{card.suite.name}", card.face_up] for card in slot.pile]
-                for slot in self.foundation
-            ],
-            "tableau": [
-                [[f"{card.rank.name}_{card.suite.name}", card.face_up] for card in slot.pile]
-                for slot in self.tableau
-            ],
-        }
-        with open(filename, "w") as file:
-            json.dump(state, file)
-
-    def load_game(self, filename="saved_game.json"):
-        """Carrega o estado do jogo de um arquivo JSON."""
-        with open(filename, "r") as file:
-            state = json.load(file)
-        self.restore_state(state)
-        self.update()
+    def restore_state(self, state):
+        """Restaura o jogo para um estado no formato JSON."""
+        self.restore_saved(savefile.decode_json(state))
+
+    @timed("restore_state")
+    def restore_saved(self, saved, journal_id=None, generation=0):
+        """Restaura um jogo salvo, movendo só as cartas que mudaram.
+
+        O diário recomeça com o estado restaurado, com o mesmo identificador
+        (o que o cliente guardou); ``journal_id`` continua o diário de um jogo
+        retomado.
+        """
+        with self.batch():
+            # Só as cartas que mudaram de lugar ou de face são redesenhadas, pilha a pilha
+            changed = set(self.game.load(saved.piles, saved.face_up))
+            for cards in self.game.piles:
+                self.render_cards([card_id for card_id in cards if card_id in changed])
+            if saved.waste_size is not None:
+                self.game.waste_size = saved.waste_size
+                self.game.passes_remaining = saved.passes_remaining
+                self.seed = saved.seed
+                self.time_remaining = saved.time_remaining
+                self.update_timer_display()
+                self.score = 0
+                self.update_score(saved.score)
+            self.display_waste()
+
+            # O histórico de deltas não se aplica ao estado restaurado
+            self.history.discard(self.game)
+            self.history.clear()
+            # Nem o registo de jogadas, que passa a não ter seed
+            self.move_log = MoveRecorder(self.game.waste_size, self.game.passes_remaining, None)
+            self.start_journal(journal_id or self.journal_id, generation)
+
+            # Atualiza a interface
+            self.update()
+            self.request_odds()
+
+    def save_game(self, slot="default"):
+        """Salva o jogo no slot indicado deste cliente; o ficheiro é escrito em segundo plano."""
+        data = savefile.encode(self.game, self.score, self.time_remaining, self.seed)
+        return savefile.save_async(savefile.slot_path(self.settings.save_dir, self.client_id, slot), data)
+
+    def load_game(self, slot="default"):
+        """Carrega o jogo do slot indicado deste cliente (ou do saved_game.json antigo)."""
+        path = savefile.slot_path(self.settings.save_dir, self.client_id, slot)
+        if not os.path.exists(path) and slot == "default" and os.path.exists(LEGACY_SAVE):
+            path = LEGACY_SAVE
+        self.restore_saved(savefile.load(path))
+
+    def export_move_log(self):
+        """Escreve o registo de jogadas em segundo plano; devolve o caminho do ficheiro."""
+        path = os.path.join(self.settings.save_dir, "logs", f"{self.seed}-{len(self.move_log.ops) // 4}.kml")
+        savefile.save_async(path, self.move_log.export(self.score))
+        return path
 
     def undo(self):
         """Desfaz a última jogada."""
-        if len(self.history) > 1:
-            print(f"Desfazendo jogada. Histórico: {len(self.history)} estados.")
-            self.history.pop()  # Remove o estado atual
-            previous_state = self.history[-1]  # Pega o estado anterior
-            self.restore_state(previous_state)
-            self.update()
-        else:
-            print("Nada para desfazer. Histórico vazio.")
+        with self.batch():
+            if len(self.history) > 0:
+                print(f"Desfazendo jogada. Histórico: {len(self.history)} jogadas.")
+                self.move_log.record_undo()
+                delta = self.history.actions[-1]
+                for pile in self.history.undo(self.game):
+                    self.render_cards(self.game.piles[pile])
+                points = delta_points(delta)
+                if points:
+                    self.update_score(-points)  # As cartas saíram da fundação
+                if self.journal is not None and self.journal.record_undo(delta, self.time_remaining):
+                    self.checkpoint_journal()
+                self.display_waste()
+                self.update()
+                self.request_odds()
+            else:
+                print("Nada para desfazer. Histórico vazio.")
         
     def create_slots(self):
         # Stock (baralho)
         self.stock = Slot(
-            solitaire=self, slot_type="stock", top=20, left=20, border=ft.border.all(1)
+            solitaire=self, slot_type="stock", index=STOCK, top=20, left=20, border=ft.border.all(1)
         )
 
         # Waste (descarte)
         self.waste = Slot(
-            solitaire=self, slot_type="waste", top=20, left=120, border=None
+            solitaire=self, slot_type="waste", index=WASTE, top=20, left=120, border=None
         )
 
         # Foundation (fundações)
@@ -210,6 +527,7 @@ class Solitaire(ft.Stack):
                 Slot(
                     solitaire=self,
                     slot_type="foundation",
+                    index=FOUNDATION[i],
                     top=20,
                     left=x,
                     border=ft.border.all(1, "outline"),
@@ -225,6 +543,7 @@ class Solitaire(ft.Stack):
                 Slot(
                     solitaire=self,
                     slot_type="tableau",
+                    index=TABLEAU[i],
                     top=150,  # Posição vertical do tableau
                     left=x,
                     border=None
@@ -232,6 +551,11 @@ class Solitaire(ft.Stack):
             )
             x += 100  # Espaçamento entre as colunas do tableau
 
+        # Slots indexados pela pilha correspondente no estado do jogo
+        self.slots = [self.stock, self.waste] + self.foundation + self.tableau
+        # Onde as cartas arrastadas podem ser largadas
+        self.drop_targets = DropTargets(self.tableau + self.foundation)
+
         # Adiciona os slots à interface
         self.controls.append(self.stock)
         self.controls.append(self.waste)
@@ -239,72 +563,214 @@ class Solitaire(ft.Stack):
         self.controls.extend(self.tableau)
         self.update()
 
-    def create_card_deck(self):
-        suites = [
-            Suite("hearts", "RED"),
-            Suite("diamonds", "RED"),
-            Suite("clubs", "BLACK"),
-            Suite("spades", "BLACK"),
-        ]
-        ranks = [
-            Rank("Ace", 1),
-            Rank("2", 2),
-            Rank("3", 3),
-            Rank("4", 4),
-            Rank("5", 5),
-            Rank("6", 6),
-            Rank("7", 7),
-            Rank("8", 8),
-            Rank("9", 9),
-            Rank("10", 10),
-            Rank("Jack", 11),
-            Rank("Queen", 12),
-            Rank("King", 13),
-        ]
-
-        self.cards = []
-
-        for suite in suites:
-            for rank in ranks:
-                file_name = f"{rank.name}_{suite.name}.svg"
-                #print(file_name)
-                self.cards.append(Card(solitaire=self, suite=suite, rank=rank))
-        # self.stock = self.cards
-        random.shuffle(self.cards)
-        self.controls.extend(self.cards)
+    def create_card_deck(self, saved=None):
+        """Cria os controles das cartas; com ``saved``, para um jogo retomado em vez de um baralho novo."""
+        # Cartas indexadas pelo identificador usado no estado do jogo
+        self.cards = CardControls(self)
+        if saved is None:
+            # Ordem do baralho baralhado
+            if self.seed is None:
+                self.seed = self.choose_seed()
+            self.deck = shuffled_deck(self.seed)
+            order = self.deck
+        else:
+            # As cartas entram na página pilha a pilha, as de baixo primeiro
+            order = [card_id for pile in saved.piles for card_id in pile]
+        if self.settings.compact_piles:
+            # Só as cartas visíveis têm controles na página; as viradas para baixo
+            # do stock e de cada coluna são desenhadas por uma única pilha
+            self.card_piles = [CardPile(solitaire=self, pile=pile) for pile in (STOCK,) + TABLEAU]
+            self.controls.extend(self.card_piles)
+        else:
+            self.controls.extend(self.cards[card_id] for card_id in order)
+            for card in self.cards.created():
+                card.attached = True
         self.update()
 
+    def choose_seed(self):
+        """Escolhe a seed do jogo, da biblioteca se for o jogo do dia ou só forem pedidos jogos com solução."""
+        draw, passes = self.settings.waste_size, int(self.settings.deck_passes_allowed)
+        library = open_library(self.settings.deal_library) if self.daily or self.settings.winnable_only else None
+        seed = None
+        if library is not None:
+            if self.daily:
+                seed = library.daily_seed(draw, passes)
+            else:
+                seed = library.random_seed(draw, passes, winnable=True)
+        if seed is None and self.daily:
+            seed = daily_seed(draw, passes)  # Sem biblioteca o jogo do dia pode não ter solução
+        return seed if seed is not None else random.randrange(2**32)
+
     def deal_cards(self):
-        # Tableau
-        card_index = 0
-        first_slot = 0
-        while card_index <= 27:
-            for slot_index in range(first_slot, len(self.tableau)):
-                self.cards[card_index].place(self.tableau[slot_index])
-                card_index += 1
-            first_slot += 1
-
-        # Reveal top cards in slot piles:
-        for number in range(len(self.tableau)):
-            #self.tableau[number].pile[-1].turn_face_up()
-            self.tableau[number].get_top_card().turn_face_up()
-
-        # Stock pile
-        for i in range(28, len(self.cards)):
-            self.cards[i].place(self.stock)
+        self.game.deal(self.deck)
+        # Pilha a pilha, para as cartas que entram na árvore ficarem pela ordem certa
+        for cards in self.game.piles:
+            self.render_cards(cards)
+        self.history.start(self.game)
+        self.started_at = time.monotonic()
+        self.move_log = MoveRecorder(self.game.waste_size, self.game.passes_remaining, self.seed)
+        self.update()
+
+    def gather_deal(self):
+        """Junta no stock as cartas distribuídas, para a distribuição ser animada no cliente.
+
+        Devolve os controles pela ordem em que são distribuídos, linha a linha.
+        """
+        dealt = []
+        for column, pile in enumerate(TABLEAU):
+            for card_id in self.game.piles[pile]:
+                card = self.cards.get(card_id)
+                if card is not None and card.visible:
+                    dealt.append((self.game.index(card_id), column, card))
+        for column, card_pile in enumerate(self.card_piles[1:]):
+            if card_pile.refresh() and card_pile.visible:
+                dealt.append((card_pile.count - 1, column, card_pile))
+        dealt.sort(key=lambda item: item[:2])
+        controls = [control for _, _, control in dealt]
+        for control in controls:
+            control.top = self.stock.top
+            control.left = self.stock.left
+            control.opacity = 0
+        return controls
+
+    def spread_deal(self, controls):
+        """Leva as cartas do stock aos seus lugares, cada uma a chegar um pouco depois da anterior."""
+        with self.batch():
+            for i, control in enumerate(controls):
+                if isinstance(control, CardPile):
+                    control.place()
+                else:
+                    self.render_card(control)
+                control.opacity = 1
+                control.animate_position = control.animate_opacity = ft.Animation(
+                    self.settings.animation_ms + DEAL_STAGGER_MS * i, ft.AnimationCurve.EASE_OUT
+                )
+            self.update(*controls)
+
+    def is_collapsed(self, card_id):
+        """Se a carta é desenhada por uma pilha compacta: as do stock e as viradas para baixo do tableau."""
+        pile = self.game.location[card_id]
+        return bool(self.card_piles) and (pile == STOCK or pile in TABLEAU and not self.game.face_up[card_id])
+
+    def render_cards(self, card_ids):
+        """Redesenha as cartas dadas; devolve as que têm controle.
+
+        As cartas escondidas pelas pilhas compactas que nunca foram vistas
+        continuam sem controle.
+        """
+        cards = []
+        for card_id in card_ids:
+            if self.cards.get(card_id) is None and self.is_collapsed(card_id):
+                continue
+            card = self.cards[card_id]
+            self.render_card(card)
+            cards.append(card)
+        return cards
+
+    def render_card(self, card):
+        """Posiciona a carta de acordo com o estado do jogo."""
+        slot = card.slot
+        if self.card_piles:
+            if self.is_collapsed(card.id):
+                # Desenhada pela pilha; uma carta que já teve controle fica na árvore, escondida
+                card.visible = False
+                return
+            self.attach(card)
+        card.animate_position = self.animation
+        card.top = slot.top
+        card.left = slot.left
+        if slot.type == "tableau":
+            card.top += self.card_offset * self.game.index(card.id)
+        card.visible = True
+        card.render_face()
+
+    def auto_moves(self):
+        """Joga sozinho as cartas seguras e termina de uma vez um jogo já resolvido.
+
+        As jogadas automáticas ficam numa única entrada do histórico; sem
+        nenhuma, não há nada a guardar.
+        """
+        with self.batch():
+            moved = False
+            if self.settings.auto_move_safe:
+                move = self.game.next_safe_move()
+                while move is not None:
+                    self.apply_auto_move(move)
+                    moved = True
+                    move = self.game.next_safe_move()
+            if self.settings.auto_complete:
+                for move in self.game.autocomplete_moves() or ():
+                    self.apply_auto_move(move)
+                    moved = True
+            if moved:
+                self.save_state()
+
+    def apply_auto_move(self, move):
+        src, dst, _ = move
+        card = self.slots[src].get_top_card()
+        self.move_on_top([card])
+        card.place(self.slots[dst])
+        top_card = self.slots[src].get_top_card()
+        if src in TABLEAU and top_card is not None and not top_card.face_up:
+            top_card.turn_face_up()
+        elif src == WASTE:
+            self.display_waste()
 
     def move_on_top(self, cards_to_drag):
         """Brings draggable card pile to the top of the stack"""
-
-        for card in cards_to_drag:
-            self.controls.remove(card)
-            self.controls.append(card)
+        if self.controls[-len(cards_to_drag):] == cards_to_drag:
+            return  # Já estão por cima
+        # Uma única passagem pela lista, em vez de um remove por carta
+        moving = set(cards_to_drag)
+        self.controls[:] = [control for control in self.controls if control not in moving] + cards_to_drag
         self.update()
 
 
+    def send_drag(self, cards):
+        """Envia a posição das cartas arrastadas, no máximo uma vez por meio frame.
+
+        O cliente já junta os eventos ao ritmo de ``drag_frame_ms``; o servidor
+        só trava clientes que enviam mais depressa, com folga para as variações
+        do intervalo. Uma posição retida é enviada no fim do frame, para as
+        cartas não ficarem para trás quando o ponteiro pára.
+        """
+        with self.lock:
+            wait = self.settings.drag_frame_ms / 2000 - (self.now() - self.last_drag_update)
+            if wait <= 0:
+                self.pending_drag = None
+                self.flush_drag(cards)
+                return
+            self.pending_drag = cards
+            if not self.drag_scheduled:
+                self.drag_scheduled = True
+                self.call_later(wait, self.send_pending_drag)
+
+    def call_later(self, delay, callback):
+        """Chama ``callback`` daqui a ``delay`` segundos, num thread dos handlers da página."""
+        loop = self.page.loop
+        loop.call_soon_threadsafe(loop.call_later, delay, self.page.run_thread, callback)
+
+    def send_pending_drag(self):
+        with self.lock:
+            self.drag_scheduled = False
+            cards, self.pending_drag = self.pending_drag, None
+            if cards:
+                self.flush_drag(cards)
+
+    def flush_drag(self, cards):
+        self.last_drag_update = self.now()
+        self.drag_updates += 1
+        self.update(*cards)
+
+    def end_drag(self):
+        """Esquece a posição retida: o drop envia a posição final."""
+        with self.lock:
+            self.pending_drag = None
+
     def bounce_back(self, cards):
         i = 0
         for card in cards:
+            card.animate_position = self.animation
             card.top = self.current_top
             if card.slot.type == "tableau":
                 card.top += i * self.card_offset
@@ -317,35 +783,41 @@ class Solitaire(ft.Stack):
         self.update()
 
     def restart_stock(self):
-        self.waste.pile.reverse()
-        while len(self.waste.pile) > 0:
-            card = self.waste.pile[0]
-            card.turn_face_down()
-            card.place(self.stock)
-        self.update()
+        self.game.recycle()  # As cartas são redesenhadas pelo evento StockRecycled
+        self.save_state()
 
     def check_foundation_rules(self, current_card, top_card=None):
-        if top_card is not None:
-            return (
-                current_card.suite.name == top_card.suite.name
-                and current_card.rank.value - top_card.rank.value == 1
-            )
-        else:
-            return current_card.rank.name == "Ace"
+        return can_place_on_foundation(current_card.id, top_card.id if top_card else None)
 
     def check_tableau_rules(self, current_card, top_card=None):
-        if top_card is not None:
-            return (
-                current_card.suite.color != top_card.suite.color
-                and top_card.rank.value - current_card.rank.value == 1
-            )
-        else:
-            return current_card.rank.name == "King"
+        return can_place_on_tableau(current_card.id, top_card.id if top_card else None)
 
     def check_if_you_won(self):
-        cards_num = 0
-        for slot in self.foundation:
-            cards_num += len(slot.pile)
-        if cards_num == 52:
-            return True
-        return False
\ No newline at end of file
+        return self.game.is_won()
+
+    def show_hint(self):
+        """Mostra a próxima jogada sugerida pelo solver."""
+        move, result = hint(self.game)
+        if move is None:
+            message = "Não há jogadas possíveis."
+        else:
+            message = self.describe_move(move)
+        if result.status == UNWINNABLE:
+            message += " (este jogo já não tem solução)"
+        self.page.snack_bar = ft.SnackBar(ft.Text(message))
+        self.page.snack_bar.open = True
+        self.page.update()
+
+    def describe_move(self, move):
+        """Descreve uma jogada do solver em texto para o jogador."""
+        src, dst, count = move
+        if src == STOCK and dst == WASTE:
+            return "Tire cartas do baralho."
+        if src == WASTE and dst == STOCK:
+            return "Recicle o baralho."
+        if src == dst:
+            return f"Vire a carta da coluna {TABLEAU.index(src) + 1}."
+        card = self.game.piles[src][-count]
+        if dst in FOUNDATION:
+            return f"Mova {CARD_NAMES[card]} para a fundação."
+        return f"Mova {CARD_NAMES[card]} para a coluna {TABLEAU.index(dst) + 1}."
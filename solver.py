@@ -0,0 +1,266 @@
+"""Solver de Klondike sobre o estado do ``Game``.
+
+Faz uma procura em profundidade com tabela de transposição: cada posição é
+reduzida a uma chave de bytes (com as colunas do tableau ordenadas, porque
+são intercambiáveis) e nunca é expandida duas vezes. As jogadas são feitas e
+desfeitas com o diário do ``Game``, sem copiar o estado em cada nó.
+
+A procura poda jogadas que raramente ajudam (tirar cartas da fundação, mover
+um Rei de uma coluna vazia para outra, mover parte de uma sequência sem
+libertar uma carta para a fundação). Esgotar esse espaço não prova nada:
+só depois de uma segunda procura com todas as jogadas legais, dentro do
+mesmo orçamento, o jogo é dado como "unwinnable"; senão fica "unknown".
+"""
+import time
+from collections import namedtuple
+
+from game import (
+    FOUNDATION, STOCK, TABLEAU, WASTE, can_place_on_foundation, can_place_on_tableau, is_safe_for_foundation,
+)
+
+SOLVED = "solved"
+UNWINNABLE = "unwinnable"
+UNKNOWN = "unknown"  # O orçamento de nós ou de tempo acabou antes do fim
+
+# Acima deste número de passagens o baralho é tratado como ilimitado
+UNLIMITED_PASSES = 100
+
+SolveResult = namedtuple("SolveResult", "status moves nodes")
+
+
+def state_key(game):
+    """Chave da posição para a tabela de transposição."""
+    piles = game.piles
+    face_up = game.face_up
+    columns = []
+    for pile in TABLEAU:
+        cards = piles[pile]
+        hidden = 0
+        while hidden < len(cards) and not face_up[cards[hidden]]:
+            hidden += 1
+        columns.append(bytes((hidden,)) + bytes(cards) + b"|")
+    columns.sort()
+    foundation = bytes(len(piles[pile]) for pile in FOUNDATION)
+    passes = min(game.passes_remaining, UNLIMITED_PASSES)
+    return b"".join(columns) + bytes(piles[STOCK]) + b"|" + bytes(piles[WASTE]) + b"|" + foundation + bytes((passes,))
+
+
+def candidate_moves(game):
+    """Jogadas a explorar, da mais promissora para a menos promissora."""
+    piles = game.piles
+    face_up = game.face_up
+    levels = game.foundation_levels()
+
+    # Virar uma carta escondida nunca prejudica
+    for pile in TABLEAU:
+        card = game.top(pile)
+        if card is not None and not face_up[card]:
+            return [((pile, pile, 0),)]
+
+    to_foundation = []
+    for src in (WASTE,) + TABLEAU:
+        card = game.top(src)
+        if card is None or not face_up[card]:
+            continue
+        for dst in FOUNDATION:
+            if can_place_on_foundation(card, game.top(dst)):
+                if is_safe_for_foundation(card, levels):
+                    return [((src, dst, 1),)]
+                to_foundation.append((src, dst, 1))
+                break
+
+    revealing = []
+    other = []
+    location = game.location
+    empty = [pile for pile in TABLEAU if not piles[pile]]
+    king_waiting = None
+    for dst in TABLEAU:
+        top = game.top(dst)
+        if top is None:
+            continue
+        value = top % 13
+        if value == 0:
+            continue
+        # Só duas cartas podem ficar por cima: as de cor oposta com o valor anterior
+        first_suite = 0 if top >= 26 else 2
+        for card in (first_suite * 13 + value - 1, (first_suite + 1) * 13 + value - 1):
+            src = location[card]
+            if src not in TABLEAU or not face_up[card]:
+                continue
+            cards = piles[src]
+            index = game.position[card]
+            count = len(cards) - index
+            if index == 0:
+                # Esvaziar uma coluna só ajuda se houver um Rei à espera dela
+                if king_waiting is None:
+                    king_waiting = any(
+                        location[king] in (STOCK, WASTE) or piles[location[king]][0] != king
+                        for king in (12, 25, 38, 51)
+                        if location[king] not in FOUNDATION
+                    )
+                if king_waiting:
+                    other.append((src, dst, count))
+            elif not face_up[cards[index - 1]]:
+                revealing.append((index, (src, dst, count)))
+            elif any(can_place_on_foundation(cards[index - 1], game.top(pile)) for pile in FOUNDATION):
+                other.append((src, dst, count))
+    if empty:
+        # Só vale a pena levar um Rei para uma coluna vazia se isso libertar cartas
+        for src in TABLEAU:
+            cards = piles[src]
+            for index in range(1, len(cards)):
+                if face_up[cards[index]]:
+                    if cards[index] % 13 == 12:
+                        revealing.append((index, (src, empty[0], len(cards) - index)))
+                    break
+
+    from_waste = []
+    if piles[WASTE]:
+        from_waste = waste_moves(game, piles[WASTE][-1], ())
+
+    # As colunas com mais cartas escondidas primeiro
+    revealing.sort(reverse=True)
+    moves = [(move,) for move in to_foundation]
+    moves.extend((move,) for _, move in revealing)
+    moves.extend(from_waste)
+    moves.extend((move,) for move in other)
+    moves.extend(stock_moves(game))
+    return moves
+
+
+def waste_moves(game, card, draws):
+    """Jogadas de ``card`` a partir do topo do waste, precedidas das tiragens ``draws``."""
+    moves = []
+    for dst in FOUNDATION:
+        if can_place_on_foundation(card, game.top(dst)):
+            moves.append(draws + ((WASTE, dst, 1),))
+            break
+    for dst in TABLEAU:
+        top = game.top(dst)
+        if can_place_on_tableau(card, top):
+            moves.append(draws + ((WASTE, dst, 1),))
+            if top is None:
+                break
+    return moves
+
+
+def stock_moves(game):
+    """Macro-jogadas: tirar cartas do baralho até chegar a uma carta jogável.
+
+    Percorre o ciclo do baralho uma vez (com uma reciclagem, se permitida) e
+    devolve, para cada carta que fica no topo do waste e pode ser jogada, a
+    sequência de tiragens seguida da jogada. Assim o baralho não acrescenta
+    níveis de profundidade sem nenhuma carta jogada.
+    """
+    size = game.waste_size
+    stock = game.piles[STOCK]
+    waste = game.piles[WASTE]
+    # Ordem pela qual as cartas do stock saem
+    order = stock[::-1]
+    moves = []
+    draws = ()
+    tops = set()
+    for drawn in range(size, len(order) + size, size):
+        drawn = min(drawn, len(order))
+        draws += ((STOCK, WASTE, drawn - len(draws) * size),)
+        card = order[drawn - 1]
+        tops.add(card)
+        moves.extend(waste_moves(game, card, draws))
+    if game.can_recycle():
+        cycle = waste + order
+        if not cycle:
+            return moves
+        draws += ((WASTE, STOCK, len(cycle)),)
+        recycled = 0
+        for drawn in range(size, len(cycle) + size, size):
+            drawn = min(drawn, len(cycle))
+            draws += ((STOCK, WASTE, drawn - recycled),)
+            recycled = drawn
+            card = cycle[drawn - 1]
+            if card in tops:
+                continue
+            tops.add(card)
+            moves.extend(waste_moves(game, card, draws))
+    return moves
+
+
+def apply_move(game, move):
+    """Executa a macro-jogada e vira a carta que ficar destapada; devolve os passos feitos."""
+    for step in move:
+        game.apply(step)
+    src = move[-1][0]
+    if src in TABLEAU and move[-1][1] != src and game.reveal(src) is not None:
+        return move + ((src, src, 0),)
+    return move
+
+
+def all_moves(game):
+    """Todas as jogadas legais, para a procura que prova que não há solução."""
+    return [(move,) for move in game.legal_moves() if move[0] not in FOUNDATION or move[1] not in FOUNDATION]
+
+
+def search(game, generate, max_nodes, deadline):
+    """Procura em profundidade com as jogadas de ``generate``; ``UNWINNABLE`` quer dizer que as esgotou."""
+    seen = {state_key(game)}
+    path = []  # (passos, posição no diário antes da jogada)
+    stack = [generate(game)[::-1]]
+    nodes = 0
+
+    while stack:
+        if game.is_won():
+            return SolveResult(SOLVED, [step for steps, _ in path for step in steps], nodes)
+        moves = stack[-1]
+        if not moves:
+            stack.pop()
+            if path:
+                _, mark = path.pop()
+                game.revert(game.journal[mark:])
+                del game.journal[mark:]
+            continue
+
+        move = moves.pop()
+        mark = len(game.journal)
+        steps = apply_move(game, move)
+        key = state_key(game)
+        if key in seen:
+            game.revert(game.journal[mark:])
+            del game.journal[mark:]
+            continue
+        seen.add(key)
+        path.append((steps, mark))
+        stack.append(generate(game)[::-1])
+
+        nodes += 1
+        if nodes >= max_nodes or (nodes & 1023 == 0 and time.perf_counter() > deadline):
+            return SolveResult(UNKNOWN, [], nodes)
+
+    return SolveResult(UNWINNABLE, [], nodes)
+
+
+def solve(game, max_nodes=200000, time_limit=1.0):
+    """Procura uma sequência de jogadas que ganhe o jogo a partir da posição dada.
+
+    Devolve um ``SolveResult`` com o estado (``SOLVED``, ``UNWINNABLE`` ou
+    ``UNKNOWN``), a lista de jogadas no formato de ``Game.apply`` e o número
+    de nós explorados. O jogo recebido não é alterado.
+    """
+    game = game.copy()
+    game.journal = bytearray()
+    deadline = time.perf_counter() + time_limit
+    result = search(game, candidate_moves, max_nodes, deadline)
+    if result.status != UNWINNABLE:
+        return result
+    # A procura podada esgotou-se: só a procura completa pode provar que não há solução
+    complete = search(game, all_moves, max_nodes - result.nodes, deadline)
+    return complete._replace(nodes=result.nodes + complete.nodes)
+
+
+def hint(game, max_nodes=50000, time_limit=0.5):
+    """Sugere a próxima jogada: a primeira da solução, ou a mais promissora se não houver."""
+    result = solve(game, max_nodes, time_limit)
+    if result.moves:
+        return result.moves[0], result
+    game = game.copy()
+    game.journal = bytearray()
+    moves = candidate_moves(game)
+    return (moves[0][0] if moves else None), result
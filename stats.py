@@ -0,0 +1,165 @@
+"""Estatísticas dos jogos e classificações, numa base de dados SQLite local.
+
+Cada jogo terminado (ganho, abandonado ou sem tempo) é uma linha de
+``games``. Os totais por modo de tiragem ficam em ``totals`` e são
+atualizados na mesma transação, para que as estatísticas não precisem de
+contar milhões de linhas. As escritas são feitas por um único thread, em
+lotes; as leituras usam uma ligação própria (o modo WAL deixa ler enquanto
+se escreve).
+"""
+import atexit
+import queue
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+GameResult = namedtuple("GameResult", "seed draw won score seconds moves played_at")
+Totals = namedtuple("Totals", "draw played wins best_score best_time")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (
+    id INTEGER PRIMARY KEY,
+    seed INTEGER NOT NULL,
+    draw INTEGER NOT NULL,
+    won INTEGER NOT NULL,
+    score INTEGER NOT NULL,
+    seconds INTEGER NOT NULL,
+    moves INTEGER NOT NULL,
+    played_at REAL NOT NULL
+);
+-- Classificação de um jogo: WHERE seed = ? AND draw = ? AND won = 1 ORDER BY score DESC
+CREATE INDEX IF NOT EXISTS games_by_seed ON games (seed, draw, won, score DESC);
+-- Melhores pontuações de sempre
+CREATE INDEX IF NOT EXISTS games_by_score ON games (draw, score DESC);
+CREATE TABLE IF NOT EXISTS totals (
+    draw INTEGER PRIMARY KEY,
+    played INTEGER NOT NULL,
+    wins INTEGER NOT NULL,
+    best_score INTEGER,
+    best_time INTEGER
+);
+"""
+
+UPDATE_TOTALS = """
+INSERT INTO totals (draw, played, wins, best_score, best_time) VALUES (?, 1, ?, ?, ?)
+ON CONFLICT (draw) DO UPDATE SET
+    played = played + 1,
+    wins = wins + excluded.wins,
+    best_score = max(coalesce(best_score, excluded.best_score), excluded.best_score),
+    best_time = CASE
+        WHEN excluded.best_time IS NULL THEN best_time
+        WHEN best_time IS NULL THEN excluded.best_time
+        ELSE min(best_time, excluded.best_time)
+    END
+"""
+
+_stores = {}  # Bases de dados abertas, partilhadas por todas as sessões do processo
+
+
+class StatsStore:
+    """Guarda os resultados em lotes num thread próprio."""
+
+    def __init__(self, path, batch_size=100, flush_interval=1.0):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.pending = queue.Queue()
+        connection = self.connect()
+        connection.executescript(SCHEMA)
+        connection.close()
+        self.thread = threading.Thread(target=self.run, name="solitaire-stats", daemon=True)
+        self.thread.start()
+
+    def connect(self):
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.execute("PRAGMA journal_mode=WAL")
+        return connection
+
+    def record(self, result):
+        """Agenda a escrita do resultado; não bloqueia quem chama."""
+        self.pending.put(result)
+
+    def run(self):
+        connection = None
+        while True:
+            results = [self.pending.get()]
+            # Junta o que chegar até encher o lote ou passar o intervalo
+            deadline = time.monotonic() + self.flush_interval
+            while results[-1] is not None and len(results) < self.batch_size:
+                try:
+                    results.append(self.pending.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            stop = results[-1] is None
+            results = [result for result in results if result is not None]
+            if results:
+                # Um erro (base de dados bloqueada, disco cheio) perde só este lote, não o thread
+                try:
+                    if connection is None:
+                        connection = self.connect()
+                    self.write(connection, results)
+                except sqlite3.Error as error:
+                    print(f"Erro ao guardar as estatísticas de {len(results)} jogos: {error}")
+            if stop:
+                if connection is not None:
+                    connection.close()
+                return
+
+    def write(self, connection, results):
+        with connection:
+            connection.executemany(
+                "INSERT INTO games (seed, draw, won, score, seconds, moves, played_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                results,
+            )
+            connection.executemany(UPDATE_TOTALS, [
+                (result.draw, int(result.won), result.score, result.seconds if result.won else None)
+                for result in results
+            ])
+
+    def close(self):
+        """Escreve o que estiver pendente e termina o thread."""
+        if self.thread.is_alive():
+            self.pending.put(None)
+            self.thread.join()
+
+    def query(self, sql, parameters=()):
+        connection = self.connect()
+        try:
+            return connection.execute(sql, parameters).fetchall()
+        finally:
+            connection.close()
+
+    def totals(self):
+        """Totais por modo de tiragem."""
+        return [Totals(*row) for row in self.query("SELECT * FROM totals ORDER BY draw")]
+
+    def leaderboard(self, seed, draw, limit=20):
+        """Melhores jogos ganhos para uma seed (por exemplo, o jogo do dia)."""
+        return [
+            GameResult(*row)
+            for row in self.query(
+                "SELECT seed, draw, won, score, seconds, moves, played_at FROM games"
+                " WHERE seed = ? AND draw = ? AND won = 1 ORDER BY score DESC LIMIT ?",
+                (seed, draw, limit),
+            )
+        ]
+
+    def seed_results(self, seed, draw):
+        """Todos os resultados registados para uma seed."""
+        return [
+            GameResult(*row)
+            for row in self.query(
+                "SELECT seed, draw, won, score, seconds, moves, played_at FROM games"
+                " WHERE seed = ? AND draw = ? ORDER BY score DESC",
+                (seed, draw),
+            )
+        ]
+
+
+def open_stats(path):
+    """Abre a base de dados uma única vez por processo."""
+    if path not in _stores:
+        _stores[path] = StatsStore(path)
+        atexit.register(_stores[path].close)
+    return _stores[path]